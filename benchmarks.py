@@ -0,0 +1,115 @@
+import random
+import time
+
+from main import PostScriptInterpreter, render_pages, tokenize
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    function()
+    print(f"{label:<48} {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+
+#Render a page from a path of random segments, once through the operators and once straight into the graphics state
+def bench_render(segments):
+    rng = random.Random(segments)
+    points = [(rng.uniform(0, 612), rng.uniform(0, 792)) for _ in range(segments + 1)]
+    source = " ".join([f"{points[0][0]:.2f} {points[0][1]:.2f} moveto"]
+                      + [f"{x:.2f} {y:.2f} lineto" for x, y in points[1:]] + ["0.5 setgray fill"])
+    interpreter = PostScriptInterpreter()
+    timed(f"render {segments} segments via operators (fill)", lambda: interpreter.execute_stream(tokenize(source)))
+
+    graphics = PostScriptInterpreter().graphics
+    def build():
+        graphics.moveto(*points[0])
+        for i in range(1, len(points) - 2, 3):
+            graphics.curveto(*points[i], *points[i + 1], *points[i + 2])
+    timed(f"build {segments // 3} curves", build)
+    timed(f"stroke {segments // 3} curves", graphics.stroke)
+    graphics.moveto(*points[0])
+    for point in points[1:]:
+        graphics.lineto(*point)
+    timed(f"fill {segments} segments", graphics.fill)
+
+
+#Many small fills, the common case on real pages, against the single large path above
+def bench_small_fills(fills=1000):
+    rng = random.Random(fills)
+    graphics = PostScriptInterpreter().graphics
+    triangles = [(rng.uniform(0, 600), rng.uniform(0, 780)) for _ in range(fills)]
+    def paint():
+        for x, y in triangles:
+            graphics.moveto(x, y)
+            graphics.lineto(x + 5, y)
+            graphics.lineto(x, y + 5)
+            graphics.fill()
+    timed(f"fill {fills} small triangles", paint)
+
+
+#Render a multi-page document serially and with one worker per core
+def bench_pages(pages, segments=2000):
+    rng = random.Random(pages)
+    body = []
+    for number in range(1, pages + 1):
+        body.append(f"%%Page: {number} {number}\n0 0 moveto\n")
+        body.extend(f"{rng.uniform(0, 612):.1f} {rng.uniform(0, 792):.1f} lineto\n" for _ in range(segments))
+        body.append("gray setgray fill showpage\n")
+    source = "%!PS-Adobe-3.0\n/gray 0.3 def\n" + "".join(body)
+    timed(f"render {pages} pages serially", lambda: render_pages(source, workers=1))
+    timed(f"render {pages} pages in parallel", lambda: render_pages(source))
+
+
+#Name lookups in a nested scope under dynamic, dict-based lexical and slot-resolved lexical scoping
+def bench_scoping(references):
+    body = ["a", "b", "add", "c", "add", "pop"] * (references // 3)
+    program = ["/a", "1", "def", "/b", "2", "def", "/c", "3", "def"]
+    nested = ["1", "dict", "begin", "/a", "1", "def", "/b", "2", "def", "/c", "3", "def"] + body + ["end"]
+    modes = {"dynamic": {}, "lexical": {"use_lexical_scoping": True},
+             "slots": {"use_lexical_scoping": True, "resolve_slots": True}}
+    for name, settings in modes.items():
+        interpreter = PostScriptInterpreter(**settings)
+        # Give dynamic lookup a realistic dictionary stack. Pushed directly, since slot mode compiles names after
+        # a begin whose end is still to come as dictionary lookups
+        interpreter.dict_stack.extend({} for _ in range(4))
+        code = program + nested
+        if interpreter.resolve_slots:
+            start = time.perf_counter()
+            code = interpreter.compile(code)
+            print(f"{'  compile':<48} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        timed(f"{references} references, {name} scoping", lambda: interpreter.execute(code))
+
+#String operators on a 1 MB input against the interpreted get loop they replace
+def bench_strings(size=10 ** 6):
+    text = "lorem ipsum " * (size // 12) + "needle 12345"
+    interpreter = PostScriptInterpreter()
+    def run(*tokens):
+        interpreter.stack = [text]
+        interpreter.execute(list(tokens))
+    timed("search for a needle at the end of 1 MB", lambda: run("(needle)", "search"))
+    timed("anchorsearch on 1 MB", lambda: run("(lorem)", "anchorsearch"))
+    timed("token from the front of 1 MB", lambda: run("token"))
+    timed("cvi of the last number in 1 MB", lambda: run("(needle )", "search", "pop", "pop", "pop", "cvi"))
+    def scan():
+        # Read every token, the rest token pushes is a view of the same string rather than a copy
+        interpreter.stack = [text]
+        while True:
+            interpreter.execute("token")
+            if not interpreter.stack.pop():
+                break
+            interpreter.stack.pop()
+    timed("token scan of all of 1 MB", scan)
+    def loop():
+        # What scripts did before search: compare the string one character at a time
+        for index in range(len(text)):
+            interpreter.stack = [text]
+            interpreter.execute([str(index), "get", "(n)", "eq"])
+    timed("interpreted get loop over 1 MB", loop)
+
+
+if __name__ == "__main__":
+    for segments in (10 ** 4, 10 ** 5):
+        bench_render(segments)
+    bench_small_fills()
+    bench_pages(16)
+    bench_scoping(3 * 10 ** 5)
+    bench_strings()
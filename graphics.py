@@ -0,0 +1,278 @@
+import math
+import struct
+import zlib
+
+import numpy as np
+
+
+class Raster:
+    """
+    An in-memory RGB framebuffer that paints polygons with vectorized scanline fills.
+    Attributes
+    width : int
+        Width in pixels.
+    height : int
+        Height in pixels.
+    pixels : numpy.ndarray
+        (height, width, 3) uint8 array, row 0 is the top of the page.
+
+    Methods
+    fill_edges(x0, y0, x1, y1, color):
+        Paints the area enclosed by a set of edges using the nonzero winding rule.
+    to_ppm():
+        Returns the raster as a binary PPM image.
+    to_png():
+        Returns the raster as a PNG image.
+    save(path):
+        Writes the raster to a .ppm or .png file.
+    """
+    # Upper bound on the edge/scanline crossings held in memory at once by fill_edges
+    batch_crossings = 1 << 22
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+
+#Paint every pixel whose centre is inside the closed polygons described by the edges (device space, y up)
+    def fill_edges(self, x0, y0, x1, y1, color):
+        sloped = y0 != y1  # Horizontal edges never cross a scanline
+        x0, y0, x1, y1 = x0[sloped], y0[sloped], x1[sloped], y1[sloped]
+        if not len(x0):
+            return
+        # Scanline k samples y = k + 0.5, an edge crosses it when its low end <= k + 0.5 < its high end
+        k_low = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, self.height).astype(np.int64)
+        k_high = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, self.height).astype(np.int64)
+        counts = np.maximum(k_high - k_low, 0)
+
+        # Only the window of scanlines and columns the path's bounding box covers is worked on, so the cost
+        # of a fill follows the size of its path rather than of the page
+        row0, row1 = int(k_low.min()), int(k_high.max())
+        col0 = int(np.clip(np.ceil(min(x0.min(), x1.min()) - 0.5), 0, self.width))
+        col1 = int(np.clip(np.ceil(max(x0.max(), x1.max()) - 0.5), 0, self.width))
+        if row1 <= row0 or col1 <= col0:
+            return
+        window = (row0, col0, col1)
+
+        # Each crossing adds its edge's winding at the first pixel centre to its right, so a running sum
+        # along a row is the winding number of every pixel; edges go in batches to bound memory
+        stride = col1 - col0 + 1
+        marks = np.zeros((row1 - row0) * stride)
+        totals = np.cumsum(counts)
+        first = 0
+        while first < len(counts):
+            last = int(np.searchsorted(totals, totals[first] - counts[first] + self.batch_crossings, side="right"))
+            last = max(last, first + 1)
+            self._mark_crossings(marks, window, x0[first:last], y0[first:last], x1[first:last], y1[first:last],
+                                 k_low[first:last], counts[first:last])
+            first = last
+        covered = np.cumsum(marks.reshape(row1 - row0, stride)[:, :-1], axis=1) != 0
+        self.pixels[self.height - row1:self.height - row0, col0:col1][covered[::-1]] = color
+
+#Add the winding of every crossing between a batch of edges and the scanlines to the marks of the window
+    def _mark_crossings(self, marks, window, x0, y0, x1, y1, k_low, counts):
+        total = int(counts.sum())
+        if not total:
+            return
+        row0, col0, col1 = window
+        edge = np.repeat(np.arange(len(counts)), counts)
+        k = k_low[edge] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        x = x0[edge] + (k + 0.5 - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+        column = np.clip(np.ceil(x - 0.5), col0, col1).astype(np.int64)
+        winding = np.where(y1 > y0, 1.0, -1.0)[edge]
+        marks += np.bincount((k - row0) * (col1 - col0 + 1) + column - col0, weights=winding, minlength=len(marks))
+
+#Encode the raster as a binary PPM image
+    def to_ppm(self):
+        return b"P6\n%d %d\n255\n" % (self.width, self.height) + self.pixels.tobytes()
+
+#Encode the raster as a PNG image, with no filtering and zlib compression
+    def to_png(self):
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        rows = np.hstack([np.zeros((self.height, 1), dtype=np.uint8), self.pixels.reshape(self.height, -1)])
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                + chunk(b"IDAT", zlib.compress(rows.tobytes())) + chunk(b"IEND", b""))
+
+#Write the raster to a file, the extension picks the format
+    def save(self, path):
+        if path.lower().endswith(".png"):
+            data = self.to_png()
+        elif path.lower().endswith(".ppm"):
+            data = self.to_ppm()
+        else:
+            raise ValueError(f"Unsupported image format: {path}")
+        with open(path, "wb") as image:
+            image.write(data)
+
+
+class GraphicsState:
+    """
+    The PostScript graphics state: transformation matrix, colour, line width and current path.
+    Attributes
+    ctm : numpy.ndarray
+        Current transformation matrix from user space to device pixels, in PostScript's row-vector form.
+    color : tuple
+        Current colour as an RGB triple of bytes.
+    line_width : float
+        Line width in user space units.
+    raster : Raster
+        The page being painted.
+
+    Methods
+    newpath(), moveto(x, y), lineto(x, y), curveto(x1, y1, x2, y2, x3, y3), closepath():
+        Build the current path, points are transformed to device space as they are added.
+    fill(), stroke():
+        Paint the current path and clear it.
+    setgray(gray), setrgbcolor(r, g, b), setlinewidth(width):
+        Set painting parameters.
+    translate(tx, ty), scale(sx, sy), rotate(angle):
+        Modify the current transformation matrix.
+    """
+    def __init__(self, width=612, height=792, resolution=72):
+        factor = resolution / 72
+        self.resolution = resolution
+        self.raster = Raster(int(round(width * factor)), int(round(height * factor)))
+        self.ctm = np.array([[factor, 0, 0], [0, factor, 0], [0, 0, 1]], dtype=float)
+        self.color = (0, 0, 0)
+        self.line_width = 1.0
+        self.newpath()
+
+#Clear the current path
+    def newpath(self):
+        self._points = []  # Device space vertices of every subpath
+        self._subpath_ids = []  # Subpath each vertex belongs to
+        self._curves = []  # (index of the end vertex, first control x, y, second control x, y)
+        self._subpath = -1
+        self._subpath_start = None
+        self._closed = False  # After closepath, the next segment starts a new subpath at the same point
+
+#Map a user space point to device space
+    def _device(self, x, y):
+        m = self.ctm
+        return (x * m[0, 0] + y * m[1, 0] + m[2, 0], x * m[0, 1] + y * m[1, 1] + m[2, 1])
+
+#Check there is a current point, reopening a closed subpath where it started
+    def _require_current_point(self, name):
+        if self._subpath_start is None:
+            raise ValueError(f"No current point for '{name}'")
+        if self._closed:
+            self._closed = False
+            self._subpath += 1
+            self._points.append(self._points[self._subpath_start])
+            self._subpath_ids.append(self._subpath)
+            self._subpath_start = len(self._points) - 1
+
+#Start a new subpath
+    def moveto(self, x, y):
+        self._subpath += 1
+        self._closed = False
+        self._subpath_start = len(self._points)
+        self._points.append(self._device(x, y))
+        self._subpath_ids.append(self._subpath)
+
+#Add a straight segment to the current subpath
+    def lineto(self, x, y):
+        self._require_current_point("lineto")
+        self._points.append(self._device(x, y))
+        self._subpath_ids.append(self._subpath)
+
+#Add a cubic Bezier segment, it is flattened together with every other curve when the path is painted
+    def curveto(self, x1, y1, x2, y2, x3, y3):
+        self._require_current_point("curveto")
+        self._curves.append((len(self._points),) + self._device(x1, y1) + self._device(x2, y2))
+        self._points.append(self._device(x3, y3))
+        self._subpath_ids.append(self._subpath)
+
+#Close the current subpath with a segment back to its first point
+    def closepath(self):
+        if self._subpath_start is not None and not self._closed:
+            self._points.append(self._points[self._subpath_start])
+            self._subpath_ids.append(self._subpath)
+            self._closed = True
+
+#Flatten the path into vertices and subpath ids, all curves are evaluated in one batch
+    def _flatten(self):
+        points = np.array(self._points, dtype=float).reshape(-1, 2)
+        ids = np.array(self._subpath_ids, dtype=np.int64)
+        if not self._curves:
+            return points, ids
+        curves = np.array(self._curves, dtype=float)
+        end = curves[:, 0].astype(np.int64)
+        control = np.stack([points[end - 1], curves[:, 1:3], curves[:, 3:5], points[end]], axis=1)
+        # Enough segments that the longest control polygon is split into roughly 2 pixel pieces
+        polygon = np.linalg.norm(np.diff(control, axis=1), axis=2).sum(axis=1)
+        steps = int(np.clip(math.ceil(polygon.max() / 2), 4, 64))
+        t = np.linspace(0, 1, steps + 1)[1:-1, None]
+        basis = np.hstack([(1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3])
+        interior = np.einsum("nj,kjd->knd", basis, control).reshape(-1, 2)
+        positions = np.repeat(end, steps - 1)
+        return np.insert(points, positions, interior, axis=0), np.insert(ids, positions, ids[positions])
+
+#Fill the current path with the nonzero winding rule, every subpath is implicitly closed
+    def fill(self):
+        points, ids = self._flatten()
+        if len(points) > 1:
+            same = ids[:-1] == ids[1:]
+            first = np.flatnonzero(np.r_[True, ~same])
+            last = np.r_[first[1:] - 1, len(points) - 1]
+            start = np.vstack([points[:-1][same], points[last]])
+            end = np.vstack([points[1:][same], points[first]])
+            self.raster.fill_edges(start[:, 0], start[:, 1], end[:, 0], end[:, 1], self.color)
+        self.newpath()
+
+#Stroke the current path: each segment becomes a quad and each vertex a square join, filled together
+    def stroke(self):
+        points, ids = self._flatten()
+        if len(points) < 2:
+            self.newpath()
+            return
+        same = ids[:-1] == ids[1:]
+        start, end = points[:-1][same], points[1:][same]
+        half = max(self.line_width * math.sqrt(abs(np.linalg.det(self.ctm[:2, :2]))), 1.0) / 2
+        direction = end - start
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        keep = length > 0
+        start, end, direction, length = start[keep], end[keep], direction[keep], length[keep]
+        normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1) * (half / length)[:, None]
+        quads = np.stack([start + normal, end + normal, end - normal, start - normal], axis=1)
+        # Squares wound the same way as the quads, so overlaps add up instead of cancelling
+        vertices = points[np.r_[same, False] | np.r_[False, same]]
+        offsets = np.array([[-half, half], [half, half], [half, -half], [-half, -half]])
+        polygons = np.vstack([quads, vertices[:, None, :] + offsets]).reshape(-1, 4, 2)
+        following = np.roll(polygons, -1, axis=1)
+        a, b = polygons.reshape(-1, 2), following.reshape(-1, 2)
+        self.raster.fill_edges(a[:, 0], a[:, 1], b[:, 0], b[:, 1], self.color)
+        self.newpath()
+
+#Set the colour to a shade of gray between 0 (black) and 1 (white)
+    def setgray(self, gray):
+        self.setrgbcolor(gray, gray, gray)
+
+#Set the colour from red, green and blue components between 0 and 1
+    def setrgbcolor(self, r, g, b):
+        self.color = tuple(int(round(min(max(c, 0.0), 1.0) * 255)) for c in (r, g, b))
+
+#Set the line width used by stroke
+    def setlinewidth(self, width):
+        if width < 0:
+            raise ValueError("Line width must be non-negative")
+        self.line_width = width
+
+#Prepend a transformation to the current transformation matrix
+    def _concat(self, matrix):
+        self.ctm = np.array(matrix, dtype=float) @ self.ctm
+
+#Move the user space origin
+    def translate(self, tx, ty):
+        self._concat([[1, 0, 0], [0, 1, 0], [tx, ty, 1]])
+
+#Scale the user space axes
+    def scale(self, sx, sy):
+        self._concat([[sx, 0, 0], [0, sy, 0], [0, 0, 1]])
+
+#Rotate the user space axes counterclockwise by an angle in degrees
+    def rotate(self, angle):
+        c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        self._concat([[c, s, 0], [-s, c, 0], [0, 0, 1]])
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+import time
 import pytest # type: ignore
 from main import PostScriptInterpreter
 
@@ -51,7 +55,7 @@ def test_define_and_lookup_with_conditionals(interpreter):
 def test_integration_scoping_dynamic(interpreter,capsys):
     commands = [
         "/x", "42", "def",       # Define x = 42
-        "dict", "begin",         # Start a new dictionary
+        "1", "dict", "begin",    # Start a new dictionary
         "/x", "100", "def",      # Define x = 100 in the new scope
         "x",                     # Should find x = 100 
         "end",                   # End the new dictionary scope
@@ -64,7 +68,7 @@ def test_integration_scoping_dynamic(interpreter,capsys):
 def test_integration_scoping_lexical(interpreter_lexical, capsys):
     commands = [
         "/x", "42", "def",       # Define x = 42
-        "dict", "begin",         # Start a new dictionary
+        "1", "dict", "begin",    # Start a new dictionary
         "/x", "100", "def",      # Define x = 100 in the new scope
         "x",                     # Should find x = 100 (inner scope)
         "end",                   # End the new dictionary scope               
@@ -124,3 +128,105 @@ def test_integration_string_operations(interpreter):
     ]
     interpreter.execute(commands)
     assert interpreter.stack == [11]
+
+
+def run_python(*args, stdin=""):
+    return subprocess.run([sys.executable, *args], input=stdin, capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def test_integration_cli_script(tmp_path):
+    script = tmp_path / "job.ps"
+    script.write_text("/x 6 def\nx 7 mul print\n")
+    result = run_python("-m", "main", str(script))
+    assert result.returncode == 0
+    assert result.stdout.strip() == "42"
+
+def test_integration_cli_stdin_and_error():
+    assert run_python("-m", "main", stdin="1 2 add print").stdout.strip() == "3"
+    result = run_python("-m", "main", "-c", "add")
+    assert result.returncode == 1
+    assert "Error" in result.stderr
+
+def test_integration_cli_nested_procedure_is_not_run():
+    result = run_python("-m", "main", "-c", "true { false { (should-not-print) print } if } if")
+    assert result.returncode == 0
+    assert result.stdout == "" and result.stderr == ""
+
+def test_integration_cli_repl():
+    result = run_python("-m", "main", "-i", stdin="1 2\nadd\n")
+    assert "PS<2>" in result.stdout
+    assert result.stdout.splitlines()[-2].endswith("3")
+
+def test_integration_cli_repl_multiline_procedure():
+    result = run_python("-m", "main", "-i", stdin="/sq {\n dup mul } def\n3 true sq if\n")
+    assert "... " in result.stdout and "Error" not in result.stdout
+    assert result.stdout.splitlines()[-2].endswith("9")
+
+def test_integration_cli_startup_time():
+    start = time.perf_counter()
+    result = run_python("-m", "main", "-c", "1 2 add print")
+    elapsed = time.perf_counter() - start
+    assert result.stdout.strip() == "3"
+    print(f"cli startup: {elapsed * 1000:.1f} ms")
+    assert elapsed < 2.0
+    result = run_python("-c", "import sys, main; main.PostScriptInterpreter().execute(['1', 'x', 'pop']); "
+                              "print('ast' in sys.modules, 'concurrent.futures' in sys.modules)")
+    assert result.stdout.strip() == "False False"
+
+PAGED_DOCUMENT = """%!PS-Adobe-3.0
+/g 0.5 def
+/size 50 def
+%%Page: 1 1
+g setgray 0 0 moveto size 0 lineto size size lineto fill showpage
+%%Page: 2 2
+0 0 1 setrgbcolor 20 20 translate 0 0 moveto size 0 lineto size size lineto fill showpage
+%%Page: 3 3
+(no graphics) pop showpage
+%%Trailer
+%%EOF
+"""
+
+def test_integration_split_pages():
+    from main import split_pages
+    prologue, pages = split_pages(PAGED_DOCUMENT)
+    assert prologue == ["/g", "0.5", "def", "/size", "50", "def"]
+    assert len(pages) == 3 and all(page[-1] == "showpage" for page in pages)
+    prologue, pages = split_pages("/a 1 def a showpage a 2 add showpage")
+    assert prologue == ["/a", "1", "def"]
+    assert pages == [["a", "showpage"], ["a", "2", "add", "showpage"]]
+
+def test_integration_render_pages_parallel_matches_serial():
+    pytest.importorskip("numpy")
+    from main import render_pages
+    serial = render_pages(PAGED_DOCUMENT, workers=1, page_size=(100, 100))
+    parallel = render_pages(PAGED_DOCUMENT, workers=2, page_size=(100, 100))
+    assert [page is None for page in parallel] == [False, False, True]
+    assert list(parallel[0].pixels[95, 30]) == [128, 128, 128]
+    assert list(parallel[1].pixels[75, 30]) == [0, 0, 255]
+    assert list(parallel[1].pixels[95, 5]) == [255, 255, 255]
+    for one, other in zip(serial[:2], parallel[:2]):
+        assert (one.pixels == other.pixels).all()
+
+def test_integration_cli_parallel_pages_use_prelude_and_code(tmp_path):
+    pytest.importorskip("numpy")
+    prelude = tmp_path / "defs.ps"
+    prelude.write_text("/size 50 def\n")
+    document = tmp_path / "doc.ps"
+    document.write_text("g setgray 0 0 moveto size 0 lineto size size lineto fill showpage\n"
+                        "0 0 moveto size 0 lineto size size lineto fill showpage\n")
+    output = str(tmp_path / "out%d.ppm")
+    result = run_python("-m", "main", "--prelude", str(prelude), "-c", "/g 0.5 def", "-j", "2", "-o", output,
+                        str(document))
+    assert result.returncode == 0, result.stderr
+    first = (tmp_path / "out1.ppm").read_bytes()
+    assert first[-612 * 3:-609 * 3] == bytes([128] * 9)  # Bottom left corner of page 1 is gray
+    assert (tmp_path / "out2.ppm").exists()
+
+def test_integration_cli_several_pages_need_numbered_output(tmp_path):
+    pytest.importorskip("numpy")
+    output = tmp_path / "out.ppm"
+    result = run_python("-m", "main", "-c", "showpage showpage", "-o", str(output))
+    assert result.returncode == 1
+    assert "%d" in result.stderr and not output.exists()
+    result = run_python("-m", "main", "-c", "showpage", "-o", str(output))
+    assert result.returncode == 0 and output.read_bytes().endswith(b"\xff" * 30)
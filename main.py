@@ -1,4 +1,296 @@
-import ast
+import math
+import os
+import sys
+
+# Commands that read or write interpreter state beyond the operands a procedure
+# is handed. A procedure using any of them cannot be split across workers.
+STATEFUL_COMMANDS = frozenset({
+    "def", "begin", "end", "dict", "put", "putinterval", "count", "clear",
+    "print", "quit", "exit", "stop", "forall", "parallelforall", "parallelmap",
+    "undef", "store", "currentdict", "copy",
+    "newpath", "moveto", "lineto", "curveto", "closepath", "fill", "stroke",
+    "setgray", "setrgbcolor", "setlinewidth", "translate", "scale", "rotate", "showpage",
+    "vmstatus",
+})
+
+# PostScript integers are 32-bit; results outside this range become reals
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Operators each numeric mode swaps into the command table, the "fast" default swaps none
+NUMERIC_OPERATORS = {
+    "fast": {},
+    "postscript": {
+        "add": "_ps_add", "sub": "_ps_sub", "mul": "_ps_mul", "div": "_ps_div",
+        "idiv": "_ps_idiv", "mod": "_ps_mod", "abs": "_ps_abs", "neg": "_ps_neg",
+        "ceiling": "_ps_ceiling", "floor": "_ps_floor", "round": "_ps_round", "sqrt": "_ps_sqrt",
+    },
+    "bigint": {
+        "div": "_bigint_div", "idiv": "_bigint_idiv", "mod": "_bigint_mod", "sqrt": "_bigint_sqrt",
+    },
+    "decimal": {
+        "add": "_decimal_add", "sub": "_decimal_sub", "mul": "_decimal_mul", "div": "_decimal_div",
+        "idiv": "_decimal_idiv", "mod": "_decimal_mod", "abs": "_decimal_abs", "neg": "_decimal_neg",
+        "ceiling": "_decimal_ceiling", "floor": "_decimal_floor", "round": "_decimal_round",
+        "sqrt": "_decimal_sqrt",
+    },
+}
+
+# Source tokens: comments, procedure braces, the start of a string, anything else
+TOKEN_REGEX = r"%[^\n]*|[{}]|\(|[^\s{}()%]+"
+
+# Whitespace and comments in front of a token
+SKIP_REGEX = r"(?:\s|%[^\n]*)*"
+
+# Approximate VM cost of a dictionary and of each entry it has room for (hash index plus key/value entry)
+DICT_BYTES, DICT_ENTRY_BYTES = 64, 48
+
+class _Undefined:
+    """
+    Type of UNDEFINED, pickled and copied by name so workers keep the same sentinel.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return "UNDEFINED"
+
+    def __repr__(self):
+        return "UNDEFINED"
+
+
+# Value of a name that has not been defined yet
+UNDEFINED = _Undefined()
+
+
+class IncompleteSourceError(SyntaxError):
+    """
+    Raised by tokenize when the source ends inside a procedure body or a string.
+    """
+
+
+class Procedure(list):
+    """
+    A `{ ... }` procedure body. execute pushes it as data; if, repeat, forall and the other control
+    operators run its tokens.
+    """
+    __slots__ = ()
+
+
+class Slot(str):
+    """
+    A name pushed by `/name` in slot-resolved mode, remembering the frame whose dictionary def should fill.
+    """
+    __slots__ = ("frame",)
+
+    def __new__(cls, name, frame):
+        slot = super().__new__(cls, name)
+        slot.frame = frame
+        return slot
+
+
+class Substring:
+    """
+    The rest of a string pushed by token: a view of the string from an offset, so reading a whole string token
+    by token copies nothing but the tokens. The string operators take it like a string, str() gives the text.
+    """
+    __slots__ = ("base", "start")
+
+    def __init__(self, base, start):
+        self.base, self.start = base, start
+
+    def __str__(self):
+        return self.base[self.start:]
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __len__(self):
+        return len(self.base) - self.start
+
+    def __iter__(self):
+        return (self.base[i] for i in range(self.start, len(self.base)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return str(self)[key]
+            return self.base[self.start + start:self.start + max(start, stop)]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("string index out of range")
+        return self.base[self.start + key]
+
+    def __eq__(self, other):
+        return str(self) == str(other) if isinstance(other, (str, Substring)) else NotImplemented
+
+    def __lt__(self, other):
+        return str(self) < str(other) if isinstance(other, (str, Substring)) else NotImplemented
+
+    def __gt__(self, other):
+        return str(self) > str(other) if isinstance(other, (str, Substring)) else NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def find(self, sub):
+        index = self.base.find(sub, self.start)
+        return index if index < 0 else index - self.start
+
+    def startswith(self, prefix):
+        return self.base.startswith(prefix, self.start)
+
+
+class CompiledCode(list):
+    """
+    A token list whose names have been resolved to frame slots by PostScriptInterpreter.compile.
+    """
+    __slots__ = ()
+
+
+class Closure(list):
+    """
+    A procedure in slot-resolved mode. As data it is the list of its source tokens; call runs its compiled
+    code in the frame it was created in.
+    """
+    __slots__ = ("code", "frame")
+
+    def __init__(self, tokens, code, frame):
+        super().__init__(tokens)
+        self.code = code
+        self.frame = frame
+
+
+class Instruction:
+    """
+    Base class for the resolved operations in compiled code, execute calls run(interpreter).
+    """
+    __slots__ = ()
+
+
+class LoadSlot(Instruction):
+    """
+    Push the value of a name in the frame `depth` frames up from the current one, or in the global frame if
+    depth is None. The dictionaries begun by the blocks in between are checked first, since they may define the
+    name too. A frame's dictionary holds its values, so put, undef and copy on it are seen straight away.
+    """
+    __slots__ = ("name", "depth")
+
+    def __init__(self, name, depth):
+        self.name, self.depth = name, depth
+
+    def run(self, interpreter):
+        frame, depth = interpreter._frame, self.depth
+        while depth != 0 and frame[0] is not None:  # Only the global frame has no parent
+            if self.name in frame[1]:
+                interpreter.stack.append(frame[1][self.name])
+                return
+            frame = frame[0]
+            if depth is not None:
+                depth -= 1
+        scope = interpreter.dict_stack[0] if frame[1] is None else frame[1]
+        value = scope.get(self.name, UNDEFINED)
+        if value is UNDEFINED:
+            interpreter.execute(self.name)  # Not defined yet, fall back to the dictionaries
+        else:
+            interpreter.stack.append(value)
+
+
+class PushSlot(LoadSlot):
+    """
+    Push `/name` as a Slot bound to the frame it resolves to.
+    """
+    __slots__ = ()
+
+    def run(self, interpreter):
+        if self.depth is None:
+            frame = interpreter._global_frame
+        else:
+            frame = interpreter._frame
+            for _ in range(self.depth):
+                frame = frame[0]
+        interpreter.stack.append(Slot(self.name, frame))
+
+
+class EnterBlock(Instruction):
+    """
+    A `begin` whose matching `end` is in the same code: begins the dictionary and opens a frame for it.
+    """
+    __slots__ = ()
+
+    def run(self, interpreter):
+        interpreter.begin()
+        interpreter._frame = [interpreter._frame, interpreter.dict_stack[-1]]
+
+
+class LeaveBlock(Instruction):
+    """
+    The `end` matching an EnterBlock: ends the dictionary and closes the frame.
+    """
+    __slots__ = ()
+
+    def run(self, interpreter):
+        interpreter.end()
+        interpreter._frame = interpreter._frame[0]
+
+
+class OpenBlock(Instruction):
+    """
+    A `begin` whose `end` is not in the same code, e.g. a later REPL line: begins the dictionary without a frame,
+    and code compiled before the matching `end` leaves names to the dictionaries.
+    """
+    __slots__ = ()
+
+    def run(self, interpreter):
+        interpreter.begin()
+        interpreter._open_blocks += 1
+
+
+class CloseBlock(Instruction):
+    """
+    An `end` compiled while an OpenBlock is open.
+    """
+    __slots__ = ()
+
+    def run(self, interpreter):
+        interpreter.end()
+        interpreter._open_blocks = max(interpreter._open_blocks - 1, 0)
+
+
+class MakeClosure(Instruction):
+    """
+    A procedure literal: pushes a Closure of its compiled body over the current frame. An array literal
+    written as text is parsed again each time, so every execution gets a fresh list as before.
+    """
+    __slots__ = ("code", "source")
+
+    def __init__(self, code, source):
+        self.code, self.source = code, source
+
+    def run(self, interpreter):
+        tokens = self.source
+        if type(tokens) is str:
+            import ast
+            tokens = ast.literal_eval(tokens)
+        interpreter.stack.append(Closure(tokens, self.code, interpreter._frame))
+
+
+class PSDict(dict):
+    """
+    A PostScript dictionary: a dict that remembers the capacity it was created with.
+    Attributes
+    capacity : int
+        The `n` operand of `n dict`, reported by maxlength until the dictionary outgrows it.
+    """
+    __slots__ = ("capacity",)
+
+    def __init__(self, capacity=0):
+        super().__init__()
+        self.capacity = capacity
+
+    def maxlength(self):
+        return max(self.capacity, len(self))
+
 
 class PostScriptInterpreter:
     """
@@ -10,10 +302,38 @@ class PostScriptInterpreter:
         Dictionary stack.
     use_lexical_scoping : bool
         Flag to determine if lexical scoping is used.
+    resolve_slots : bool
+        With lexical scoping, compile names to (depth, slot) frame references and let procedures
+        capture the frame they are defined in.
+    page_size : tuple
+        Page width and height in points, used by the graphics operators.
+    resolution : int
+        Raster resolution in pixels per inch.
+    vm_used : int
+        Approximate bytes of composite objects (strings, arrays, dictionaries) the job has created.
+    vm_limit : int or None
+        Byte cap on vm_used, exceeding it raises MemoryError.
+    numeric_mode : str
+        "fast" (plain Python numbers), "postscript" (32-bit integers overflowing to reals),
+        "bigint" (exact integers and fractions) or "decimal" (fixed precision decimals).
         
     Methods
     execute(command):
         Executes the user command in the stack.
+    compile(command):
+        Resolves the names in a command to frame slots for slot-resolved lexical scoping.
+    execute_stream(tokens):
+        Executes tokens as they arrive, pushing procedure bodies instead of running them.
+    call(proc):
+        Runs a procedure, as the control operators do.
+    load_program(command):
+        Queues a command for incremental execution.
+    run_steps(n):
+        Executes at most n queued tokens, including those inside loop bodies, returning True while more remain.
+    steps(command, chunk_size):
+        Generator that executes a command in chunks, yielding the tokens executed so far.
+    run(command, chunk_size):
+        Coroutine that executes a command in chunks, yielding to the event loop between them.
     lookup(name):
         Looks up the value of a name in the dictionary stack.
     def_():
@@ -55,7 +375,21 @@ class PostScriptInterpreter:
     sqrt():
         Computes the square root of the top element on the stack.
     dict():
-        Pushes an empty dictionary onto the stack.
+        Pushes an empty dictionary with the capacity from the stack.
+    maxlength():
+        Pushes the capacity of a dictionary.
+    currentdict():
+        Pushes the current dictionary.
+    known():
+        Checks if a key is defined in a dictionary.
+    where():
+        Finds the dictionary on the dictionary stack that defines a key.
+    undef():
+        Removes a key from a dictionary.
+    load():
+        Pushes the value of a key looked up on the dictionary stack.
+    store():
+        Replaces a key's value where it is defined, or defines it in the current dictionary.
     length():
         Pushes the length of the top element on the stack.
     begin():
@@ -91,7 +425,7 @@ class PostScriptInterpreter:
     ifelse():
         Executes one of two blocks based on the top element on the stack.
     copy():
-        Copies the top n elements on the stack.
+        Copies the top n elements on the stack, or an array, string or dictionary into another one.
     get():
         Gets an element from a container on the stack.
     getinterval():
@@ -108,33 +442,125 @@ class PostScriptInterpreter:
         Applies a procedure to each element in a container.
     for_():
         Executes a procedure for a range of values.
+    parallelforall():
+        Applies a side-effect-free procedure to each element using a process pool.
+    parallelmap():
+        Like parallelforall, but collects the results into a single list.
+    graphics:
+        The graphics state (graphics.GraphicsState), created on first use.
+    newpath(), moveto(), lineto(), curveto(), closepath():
+        Build the current path.
+    fill(), stroke():
+        Paint the current path into the raster.
+    setgray(), setrgbcolor(), setlinewidth():
+        Set the colour and line width.
+    translate(), scale(), rotate():
+        Transform user space.
+    showpage():
+        Finishes the current page, appending its raster to pages.
+    search():
+        Finds a substring, pushing the text after it, the match, the text before it and True, or False.
+    anchorsearch():
+        Checks if a string starts with a substring, pushing the rest, the match and True, or False.
+    token():
+        Reads the first token of a string, pushing the rest (a Substring view), the token and True, or False.
+    cvs():
+        Converts any value to its text, checking it fits in the given string.
+    cvi(), cvr():
+        Convert a number or numeric string to an integer or a real.
+    cvn():
+        Converts a string to a name.
+    string():
+        Pushes a string of n zero bytes.
+    vmstatus():
+        Pushes the save level, the VM bytes used and the VM maximum.
+    reset_vm():
+        Starts VM accounting for a new job.
     commands():
         Returns a dictionary of command names to methods.
     """
-    def __init__(self, use_lexical_scoping=False):
+    # Containers shorter than this are always run serially by parallelforall
+    parallel_threshold = 10000
+
+    def __init__(self, use_lexical_scoping=False, parallel_workers=None, numeric_mode="fast", precision=28,
+                 page_size=(612, 792), resolution=72, resolve_slots=False, vm_limit=None):
+        if numeric_mode not in NUMERIC_OPERATORS:
+            raise ValueError(f"Unknown numeric mode: {numeric_mode!r}")
+        if resolve_slots and not use_lexical_scoping:
+            raise ValueError("resolve_slots requires use_lexical_scoping")
         self.stack = []  # Operand stack
         self.dict_stack = [{}]  # Dictionary stack
         self.use_lexical_scoping = use_lexical_scoping  # Scoping flag
+        self.parallel_workers = parallel_workers  # Pool size, None means os.cpu_count()
+        self.numeric_mode = numeric_mode
+        self.precision = precision  # Significant digits in decimal mode
+        self.page_size = page_size
+        self.resolution = resolution
+        self._graphics = None  # Created by the graphics property, so numpy is only imported when needed
+        self.pages = []  # Rasters finished by showpage, None for pages that painted nothing
+        self.vm_used = 0  # Charged as composite objects are created, never by walking the heap
+        self._literals = {}  # String literal token to the string it made, already charged
+        self.vm_limit = vm_limit
+        self._int_literal = self._ps_int_literal if numeric_mode == "postscript" else int
+        self._real_literal = None  # Reparses float literals when the mode has its own real type
+        if numeric_mode == "decimal":
+            import decimal
+            self._decimal = decimal
+            self._context = decimal.Context(prec=precision, traps=[
+                decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow])
+            self._real_literal = self._context.create_decimal
+        self._command_table = self.commands()  # Built once so execute does a single dict lookup
+        self._exec = []  # Execution stack of load_program: token iterators, the innermost running procedure last
+        self._control = {"if": self._if_calls, "ifelse": self._ifelse_calls, "repeat": self._repeat_calls,
+                         "for": self._for_calls, "forall": self._forall_calls}  # Stepped without recursing
+        self.resolve_slots = resolve_slots
+        self._global_slots = set()  # Names resolved to the global frame, shared by everything compiled
+        # Frames are lists: the parent frame and the dictionary the block began, None for the bottom dictionary
+        self._global_frame = [None, None]
+        self._frame = self._global_frame
+        self._open_blocks = 0  # OpenBlocks still waiting for their end, names compiled meanwhile stay dynamic
+        self.tokens_executed = 0  # Progress counter for incremental execution
 
 #Excute the  user command in the stack
     def execute(self, command):
         if isinstance(command, list):
+            if type(command) is Procedure or type(command) is Closure:
+                self.stack.append(command)  # A procedure is data until a control operator calls it
+                return
+            if type(command) is list and self.resolve_slots:
+                command = self.compile(command)
             for cmd in command:
                 self.execute(cmd)
         elif isinstance(command, str):
-            if command in self.commands():
-                self.commands()[command]()
+            operator = self._command_table.get(command)
+            if operator is not None:
+                operator()
             elif command.startswith("/"):
                 self.stack.append(command[1:])  # Store key without `/` for definition
+            elif command.startswith("(") and command.endswith(")") and len(command) > 1:
+                string = self._literals.get(command)  # String literal from the tokenizer
+                if string is None:
+                    # Made once like a scanned PostScript string, so a literal in a loop is charged once
+                    string = command[1:-1]
+                    self._allocate(sys.getsizeof(string))
+                    self._literals[command] = string
+                self.stack.append(string)
             elif command.isdigit() or (command[0] == '-' and command[1:].isdigit()):
-                self.stack.append(int(command))
+                self.stack.append(self._int_literal(command))
             elif command == "True":
                 self.stack.append(True)
             elif command == "False":
                 self.stack.append(False)
             else:
                 try:
-                    value = ast.literal_eval(command)
+                    if command.isidentifier() and command != "None":
+                        raise ValueError(command)  # Plain names skip the (lazily imported) parser
+                    value = self.parse_number(command)
+                    if value is None:
+                        import ast
+                        value = ast.literal_eval(command)
+                    if self._real_literal is not None and type(value) is float:
+                        value = self._real_literal(command)
                     if isinstance(command, (list, str)):
                         self.stack.append(value)
                     else:
@@ -145,9 +571,205 @@ class PostScriptInterpreter:
                         self.stack.append(value)
                     else:
                         self.stack.append(command)
+        elif isinstance(command, Instruction):
+            command.run(self)
         else:
             self.stack.append(command)
 
+#Compile a command for slot-resolved lexical scoping. Every `/name` in a balanced `begin ... end` declares
+#a slot in that block's frame, top-level names live in the global frame, and references become LoadSlot
+#instructions. Procedure bodies and array literals become closures, other nested lists run inline. After a
+#`begin` whose `end` is in later code, names are left to the dictionaries until that `end`
+    def compile(self, command):
+        if not isinstance(command, list):
+            command = [command]
+        self._global_slots.update(self._declared(command))
+        return self._compile(command, [], self._open_blocks)
+
+#Names given a `/name` literal anywhere in some tokens, in order of first appearance
+    def _declared(self, tokens):
+        names = {}
+        for token in tokens:
+            if type(token) is str and token[:1] == "[":
+                token = _literal_list(token)
+            if isinstance(token, list):
+                names.update(dict.fromkeys(self._declared(token)))
+            elif type(token) is str and token[:1] == "/" and token[1:].isidentifier():
+                names[token[1:]] = None
+        return list(names)
+
+#Map each `begin` to its matching `end` among tokens at the same level
+    def _blocks(self, tokens):
+        pairs, opened = {}, []
+        for i, token in enumerate(tokens):
+            if token == "begin":
+                opened.append(i)
+            elif token == "end" and opened:
+                pairs[opened.pop()] = i
+        return pairs
+
+#Resolve a name against the block scopes (innermost last), then the global frame
+    def _resolve(self, name, scopes, instruction):
+        for depth, scope in enumerate(reversed(scopes)):
+            if name in scope:
+                return instruction(name, depth)
+        if name in self._global_slots:
+            return instruction(name, None)
+        return None
+
+    def _compile(self, tokens, scopes, opened):
+        code = CompiledCode()
+        pairs = self._blocks(tokens)
+        resolved = {}  # Each name resolves the same way throughout one block
+        operators = self._command_table
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if type(token) is str:
+                literal = _literal_list(token) if token[:1] == "[" else None
+                if token == "begin" and i in pairs and not opened:
+                    inner = tokens[i + 1:pairs[i]]
+                    scope = set(self._declared(inner))
+                    code.append(EnterBlock())
+                    code.extend(self._compile(inner, scopes + [scope], 0))
+                    code.append(LeaveBlock())
+                    i = pairs[i]
+                elif token == "begin":
+                    code.append(OpenBlock())
+                    opened += 1
+                elif token == "end" and opened:
+                    code.append(CloseBlock())
+                    opened -= 1
+                elif literal is not None:
+                    code.append(MakeClosure(self._compile(literal, scopes, opened), token))
+                elif opened:
+                    code.append(token)  # A dictionary without a frame is on top, so lookups stay dynamic
+                elif token in resolved:
+                    code.append(resolved[token])
+                elif token[:1] == "/" and token[1:].isidentifier():
+                    resolved[token] = self._resolve(token[1:], scopes, PushSlot) or token
+                    code.append(resolved[token])
+                elif token.isidentifier() and token not in operators and token not in ("True", "False", "None"):
+                    resolved[token] = self._resolve(token, scopes, LoadSlot) or token
+                    code.append(resolved[token])
+                else:
+                    code.append(token)
+            elif isinstance(token, list):
+                body = self._compile(token, scopes, opened)
+                code.append(MakeClosure(body, token) if type(token) is Procedure else body)
+            else:
+                code.append(token)
+            i += 1
+        return code
+
+#Execute tokens one at a time, e.g. straight from tokenize(), so sources never need to be held in memory
+    def execute_stream(self, tokens):
+        if self.resolve_slots:
+            self.execute(self.compile(list(tokens)))  # Resolution needs the whole program
+            return
+        for token in tokens:
+            self.execute(token)
+
+#Run a procedure: the tokens of a `{ }` body, the code of a closure in its frame, anything else as execute would
+    def call(self, proc):
+        if type(proc) is Procedure and self.resolve_slots:
+            proc = self._closure(proc)
+        if type(proc) is Closure:
+            saved, self._frame = self._frame, proc.frame
+            try:
+                for token in proc.code:
+                    self.execute(token)
+            finally:
+                self._frame = saved
+        elif type(proc) is Procedure:
+            for token in proc:
+                self.execute(token)
+        else:
+            self.execute(proc)
+
+#In slot-resolved mode, compile a procedure built at run time (e.g. by token or getinterval) once, closed over
+#the current frame, so a loop does not compile it again for every call
+    def _closure(self, proc):
+        if self.resolve_slots and (type(proc) is list or type(proc) is Procedure):
+            return Closure(proc, self.compile(proc), self._frame)
+        return proc
+
+#Yield the tokens of a procedure in the order call would run them, nested plain lists inline and
+#`{ }` bodies as single tokens, since they are data until something calls them
+    def _body(self, proc):
+        if type(proc) is Closure:
+            saved, self._frame = self._frame, proc.frame
+            try:
+                yield from self._inline(proc.code)
+            finally:
+                self._frame = saved
+        elif isinstance(proc, list):
+            yield from self._inline(proc)
+        else:
+            yield proc
+
+    def _inline(self, tokens):
+        for token in tokens:
+            if type(token) is list or type(token) is CompiledCode:
+                yield from self._inline(token)
+            else:
+                yield token
+
+#Yield the tokens of every procedure a control operator calls, one call after another
+    def _stepped(self, calls):
+        for proc in calls:
+            yield from self._body(proc)
+
+#Queue a command so it can be executed a bounded number of tokens at a time
+    def load_program(self, command):
+        if type(command) is list and self.resolve_slots:
+            command = self.compile(command)
+        self._exec = [self._body(command)]
+        self.tokens_executed = 0
+
+#Execute at most n queued tokens, return True while more remain. Control operators push the procedures
+#they call onto the execution stack instead of running them, so tokens inside loop bodies count too
+    def run_steps(self, n):
+        executed = 0
+        while self._exec:
+            if executed == n:
+                return True
+            token = next(self._exec[-1], UNDEFINED)
+            if token is UNDEFINED:
+                self._exec.pop()
+                continue
+            try:
+                calls = self._control.get(token) if type(token) is str else None
+                if calls is not None:
+                    self._exec.append(self._stepped(calls()))
+                else:
+                    self.execute(token)
+            except BaseException:
+                for pending in reversed(self._exec):
+                    pending.close()  # Restores the frames of closures that were running
+                self._exec = []
+                raise
+            executed += 1
+            self.tokens_executed += 1
+        return False
+
+#Execute a command chunk by chunk, yielding the number of tokens executed after each chunk
+    def steps(self, command, chunk_size=1000):
+        self.load_program(command)
+        reported = None
+        while self.run_steps(chunk_size):
+            reported = self.tokens_executed
+            yield reported
+        if self.tokens_executed != reported:
+            yield self.tokens_executed  # Unless the last chunk ended exactly at the end of the program
+
+#Execute a command chunk by chunk, giving other tasks on the event loop a turn between chunks
+    async def run(self, command, chunk_size=1000):
+        import asyncio
+        for _ in self.steps(command, chunk_size):
+            await asyncio.sleep(0)
+        return self.stack
+
 #Look up the value of a name in the dictionary stack
     def lookup(self, name):
         if self.use_lexical_scoping:
@@ -159,13 +781,29 @@ class PostScriptInterpreter:
                     return d[name]
         return None
 
+#Find the dictionary that defines a name, following the same scoping rule as lookup
+    def find_dict(self, name):
+        if self.use_lexical_scoping:
+            return self.dict_stack[-1] if name in self.dict_stack[-1] else None
+        for d in reversed(self.dict_stack):
+            if name in d:
+                return d
+        return None
+
 #Define a new key-value pair in the dictionary stack
     def def_(self):
         value = self.stack.pop()
         key = self.stack.pop()
+        if type(key) is Substring:
+            key = str(key)  # Keys hold their own text, not the string they were read from
         if not isinstance(key, str):
             raise TypeError("The key for 'def' must be a string")
 
+        if type(key) is Slot:
+            # The frame's dictionary is the only copy of the value, keyed by the plain name
+            d = self.dict_stack[0] if key.frame[1] is None else key.frame[1]
+            d[str(key)] = value
+            return
         if self.use_lexical_scoping:
             self.dict_stack[-1][key] = value
         else:
@@ -175,6 +813,30 @@ class PostScriptInterpreter:
                     return
             self.dict_stack[-1][key] = value
 
+#Charge bytes to the job's VM, failing the job once it goes over vm_limit
+    def _allocate(self, size):
+        if self.vm_limit is not None and self.vm_used + size > self.vm_limit:
+            raise MemoryError(f"VMerror: {self.vm_used} bytes used, {size} more requested, limit is {self.vm_limit}")
+        self.vm_used += size
+
+#Start VM accounting for a new job
+    def reset_vm(self):
+        self.vm_used = 0
+        self._literals.clear()
+
+#Push the save level (always 0, there is no save/restore), the VM bytes used and the maximum
+    def vmstatus(self):
+        self.stack.extend((0, self.vm_used, self.vm_limit if self.vm_limit is not None else INT_MAX))
+
+#Parse numeric text the way this interpreter's numeric mode reads number literals, None if it is not a number
+    def parse_number(self, text):
+        value = parse_number(text)
+        if type(value) is int:
+            return self._int_literal(text) if "#" not in text else value
+        if value is not None and self._real_literal is not None:
+            return self._real_literal(text)
+        return value
+
 #Check if a value can be converted to a float throw an exception if it can't
     def is_float(self, value):
         try:
@@ -272,13 +934,13 @@ class PostScriptInterpreter:
     def ceiling(self):
         if not self.stack:
             raise IndexError("No elements to apply ceiling")
-        self.stack.append(int(float(self.stack.pop()) + 0.999999))
+        self.stack.append(math.ceil(self.stack.pop()))
 
 #Compute the floor of the top element on the stack
     def floor(self):
         if not self.stack:
             raise IndexError("No elements to apply floor")
-        self.stack.append(int(float(self.stack.pop())))
+        self.stack.append(math.floor(self.stack.pop()))
 
 #Round the top element on the stack
     def round(self):
@@ -292,23 +954,91 @@ class PostScriptInterpreter:
             raise IndexError("No elements to apply sqrt")
         self.stack.append(float(self.stack.pop()) ** 0.5)
 
-#Push an empty dictionary onto the stack
+#Push an empty dictionary with room for n entries
     def dict(self):
-        self.stack.append({})
+        if not self.stack:
+            raise IndexError("No elements for 'dict'")
+        capacity = self.stack.pop()
+        if type(capacity) is not int or capacity < 0:
+            raise TypeError("Invalid argument: 'dict' requires a non-negative integer")
+        self._allocate(DICT_BYTES + DICT_ENTRY_BYTES * capacity)
+        self.stack.append(PSDict(capacity))
+
+#Push the capacity of a dictionary
+    def maxlength(self):
+        if not self.stack:
+            raise IndexError("No elements for 'maxlength'")
+        d = self.stack.pop()
+        if not isinstance(d, dict):
+            raise TypeError("Invalid type for 'maxlength': expected dictionary")
+        self.stack.append(d.maxlength() if isinstance(d, PSDict) else len(d))
+
+#Push the current dictionary
+    def currentdict(self):
+        self.stack.append(self.dict_stack[-1])
+
+#Check if a key is defined in a dictionary
+    def known(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'known'")
+        key, d = self.stack.pop(), self.stack.pop()
+        if not isinstance(d, dict):
+            raise TypeError("Invalid type for 'known': expected dictionary")
+        self.stack.append(key in d)
+
+#Push the dictionary defining a key and True, or just False
+    def where(self):
+        if not self.stack:
+            raise IndexError("No elements for 'where'")
+        d = self.find_dict(self.stack.pop())
+        if d is None:
+            self.stack.append(False)
+        else:
+            self.stack.extend((d, True))
+
+#Remove a key from a dictionary, missing keys are ignored
+    def undef(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'undef'")
+        key, d = self.stack.pop(), self.stack.pop()
+        if not isinstance(d, dict):
+            raise TypeError("Invalid type for 'undef': expected dictionary")
+        d.pop(key, None)
+
+#Push the value of a key found on the dictionary stack
+    def load(self):
+        if not self.stack:
+            raise IndexError("No elements for 'load'")
+        key = self.stack.pop()
+        d = self.find_dict(key)
+        if d is None:
+            raise KeyError(f"Undefined name for 'load': {key}")
+        self.stack.append(d[key])
+
+#Replace a key's value in the dictionary that defines it, or define it in the current dictionary
+    def store(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'store'")
+        value, key = self.stack.pop(), self.stack.pop()
+        key = str(key) if type(key) is Slot else key  # Slot values live in the dictionaries, so look it up as usual
+        d = self.find_dict(key)
+        (self.dict_stack[-1] if d is None else d)[key] = value
 
 #Push the length of the top element on the stack
     def length(self):
         if not self.stack:
             raise IndexError("No elements to get length")
         top = self.stack.pop()
-        if not isinstance(top, (str, list)):
-            raise TypeError("Operand must be a string or list to get length")
+        if not isinstance(top, (str, Substring, list, dict)):
+            raise TypeError("Operand must be a string, list or dictionary to get length")
         self.stack.append(len(top))
 
 #Begin a new dictionary scope
     def begin(self):
         if not self.stack:
             raise IndexError("No element to begin with")
+        if not isinstance(self.stack[-1], dict):
+            raise TypeError("Invalid type for 'begin': expected dictionary")
         self.dict_stack.append(self.stack.pop())
 
 #End the current dictionary scope
@@ -385,52 +1115,93 @@ class PostScriptInterpreter:
 
 #Execute a block if the top element on the stack is True
     def if_(self):
+        for block in self._if_calls():
+            self.call(block)
+
+    def _if_calls(self):
         if len(self.stack) < 2:
             raise IndexError("Not enough elements for 'if'")
         block, condition = self.stack.pop(), self.stack.pop()
-        if condition:
-            self.execute(block)
+        return (self._closure(block),) if condition else ()
 
 #if the top element on the stack is True, execute the first block, otherwise execute the second block
     def ifelse(self):
+        for block in self._ifelse_calls():
+            self.call(block)
+
+    def _ifelse_calls(self):
         if len(self.stack) < 3:
             raise IndexError("Not enough elements for 'ifelse'")
         false_block, true_block, condition = self.stack.pop(), self.stack.pop(), self.stack.pop()
-        if condition:
-            self.execute(true_block)
-        else:
-            self.execute(false_block)
+        return (self._closure(true_block if condition else false_block),)
 
 #Copy the top n elements on the stack
     def copy(self):
         if not self.stack:
             raise IndexError("No elements to copy")
+        if isinstance(self.stack[-1], (list, str, Substring, dict)):
+            self._copy_composite()
+            return
         n = self.stack.pop()
         if not isinstance(n, int) or n < 0:
             raise TypeError("Invalid argument: 'copy' requires a non-negative integer")
         if n > len(self.stack):
             raise IndexError("Not enough elements to copy")
-        self.stack.extend(self.stack[-n:])
-        
+        if n:
+            self.stack.extend(self.stack[-n:])  # Only references are copied, no VM is used
+
+#Copy an array, string or dictionary into another of the same type: arrays and strings push the part of the
+#destination that was written, dictionaries push the destination. New objects and entries are charged to VM
+    def _copy_composite(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'copy'")
+        target, source = self.stack.pop(), self.stack.pop()
+        if isinstance(source, dict) and isinstance(target, dict):
+            added = sum(1 for key in source if key not in target)
+            room = target.maxlength() if isinstance(target, PSDict) else len(target)
+            self._allocate(DICT_ENTRY_BYTES * max(len(target) + added - room, 0))
+            target.update(source)
+            self.stack.append(target)
+        elif isinstance(source, list) and isinstance(target, list):
+            if len(source) > len(target):
+                raise IndexError("Destination of 'copy' is shorter than the source")
+            result = target if len(source) == len(target) else list(source)  # Equals target[:n] after the copy
+            if result is not target:
+                self._allocate(sys.getsizeof(result))
+            target[:len(source)] = source
+            self.stack.append(result)
+        elif isinstance(source, (str, Substring)) and isinstance(target, (str, Substring)):
+            if len(source) > len(target):
+                raise IndexError("Destination of 'copy' is shorter than the source")
+            source = str(source)
+            self._allocate(sys.getsizeof(source))  # Strings are immutable, the copied part is a new string
+            self.stack.append(source)
+        else:
+            raise TypeError("Invalid type for 'copy': expected two arrays, two strings or two dictionaries")
+
 #Get an element from a container on the stack
     def get(self):
         if len(self.stack) < 2:
             raise IndexError("Not enough elements for 'get'")
         index, container = self.stack.pop(), self.stack.pop()
-        if isinstance(container, (str, list)):
+        if isinstance(container, (str, Substring, list)):
+            self.stack.append(container[index])
+        elif isinstance(container, dict):
+            if index not in container:
+                raise KeyError(f"Undefined key for 'get': {index}")
             self.stack.append(container[index])
         else:
-            raise TypeError("Invalid type for 'get': expected string or list")
+            raise TypeError("Invalid type for 'get': expected string, list or dictionary")
 
 #Get a subinterval from a container on the stack
     def getinterval(self):
         if len(self.stack) < 3:
             raise IndexError("Not enough elements for 'getinterval'")
         count, index, container = self.stack.pop(), self.stack.pop(), self.stack.pop()
-        if isinstance(container, str):
-            self.stack.append(container[index:index + count])
-        elif isinstance(container, list):
-            self.stack.append(container[index:index + count])
+        if isinstance(container, (str, Substring, list)):
+            interval = container[index:index + count]
+            self._allocate(sys.getsizeof(interval))
+            self.stack.append(interval)
         else:
             raise TypeError("Invalid type for 'getinterval': expected string or list")
 
@@ -439,25 +1210,165 @@ class PostScriptInterpreter:
         if len(self.stack) < 3:
             raise IndexError("Not enough elements for 'putinterval'")
         substring, index, container = self.stack.pop(), self.stack.pop(), self.stack.pop()
-        if isinstance(container, str):
+        if isinstance(container, (str, Substring)):
             container = list(container)
             container[index:index + len(substring)] = list(substring)
-            self.stack.append(''.join(container))
+            string = ''.join(container)
+            self._allocate(sys.getsizeof(string))
+            self.stack.append(string)
         elif isinstance(container, list):
+            before = sys.getsizeof(container)
             container[index:index + len(substring)] = substring
+            self._allocate(max(sys.getsizeof(container) - before, 0))  # Only growth is new memory
             self.stack.append(container)
         else:
             raise TypeError("Invalid type for 'putinterval': expected string or list")
 
+#Pop a string and a substring to look for, checking both are strings
+    def _search_operands(self, name):
+        if len(self.stack) < 2:
+            raise IndexError(f"Not enough elements for '{name}'")
+        seek, string = self.stack.pop(), self.stack.pop()
+        if not isinstance(string, (str, Substring)) or not isinstance(seek, (str, Substring)):
+            raise TypeError(f"Invalid type for '{name}': expected strings")
+        return string, str(seek)
+
+#Find the first occurrence of a substring: push post, match, pre and True, or the string and False
+    def search(self):
+        string, seek = self._search_operands("search")
+        index = string.find(seek)
+        if index < 0:
+            self.stack.extend((string, False))
+        else:
+            self.stack.extend((string[index + len(seek):], seek, string[:index], True))
+
+#Check for a prefix: push post, match and True, or the string and False
+    def anchorsearch(self):
+        string, seek = self._search_operands("anchorsearch")
+        if string.startswith(seek):
+            self.stack.extend((string[len(seek):], seek, True))
+        else:
+            self.stack.extend((string, False))
+
+#Read the first token of a string: push the rest, the token and True, or False when only whitespace is left
+#The rest is a Substring view of the same string, so reading a whole string token by token stays linear
+    def token(self):
+        if not self.stack:
+            raise IndexError("No elements for 'token'")
+        string = self.stack.pop()
+        if isinstance(string, Substring):
+            string, start = string.base, string.start
+        elif isinstance(string, str):
+            start = 0
+        else:
+            raise TypeError("Invalid type for 'token': expected string")
+        scanned = scan_token(string, start)
+        if scanned is None:
+            self.stack.append(False)
+            return
+        raw, end = scanned
+        self.stack.extend((Substring(string, end), self._token_value(raw), True))
+
+#The value of a token read by token: strings and names without their delimiters, numbers parsed
+    def _token_value(self, raw):
+        if isinstance(raw, list):
+            return raw  # A procedure body, as tokenize produces it
+        if raw.startswith("(") or (raw.startswith("/") and len(raw) > 1):
+            return raw[1:-1] if raw.startswith("(") else raw[1:]
+        value = self.parse_number(raw)
+        return raw if value is None else value
+
+#Convert any value to text, it must fit in the string given as a buffer
+    def cvs(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'cvs'")
+        buffer, value = self.stack.pop(), self.stack.pop()
+        if not isinstance(buffer, (str, Substring)):
+            raise TypeError("Invalid type for 'cvs': expected string")
+        if isinstance(value, bool):
+            text = "true" if value else "false"
+        elif isinstance(value, (str, Substring, int, float)) or hasattr(value, "__float__"):
+            text = str(value)
+        else:
+            text = "--nostringval--"
+        if len(text) > len(buffer):
+            raise IndexError("String too short for 'cvs'")
+        self.stack.append(text)
+
+#Pop a number, or a string holding one, for cvi and cvr
+    def _convert_operand(self, name):
+        if not self.stack:
+            raise IndexError(f"No elements for '{name}'")
+        value = self.stack.pop()
+        if isinstance(value, (str, Substring)):
+            number = self.parse_number(str(value).strip())
+            if number is None:
+                raise ValueError(f"Invalid number for '{name}': {value!r}")
+            return number
+        if isinstance(value, bool) or not isinstance(value, (int, float)) and not hasattr(value, "__float__"):
+            raise TypeError(f"Invalid type for '{name}': expected number or string")
+        return value
+
+#Convert to an integer, truncating toward zero. The result is read like an integer literal, so in postscript
+#mode one outside 32 bits is a range error rather than a longer integer
+    def cvi(self):
+        value = self._finite(self._convert_operand("cvi"), "cvi")
+        result = self._int_literal(str(int(value)))
+        if type(result) is not int:
+            raise ValueError(f"Result of 'cvi' out of integer range: {int(value)}")
+        self.stack.append(result)
+
+#Convert to a real of the numeric mode's type
+    def cvr(self):
+        value = self._finite(self._convert_operand("cvr"), "cvr")
+        if self._real_literal is not None:
+            result = self._real_literal(repr(value) if type(value) is float else value)
+        else:
+            try:
+                result = float(value)
+            except OverflowError:
+                raise ValueError(f"Result of 'cvr' out of real range: {value}") from None
+        self.stack.append(result)
+
+#Reject infinities and NaN, which have no integer or PostScript real value
+    def _finite(self, value, name):
+        finite = value.is_finite() if hasattr(value, "is_finite") else type(value) is not float or math.isfinite(value)
+        if not finite:
+            raise ValueError(f"Invalid number for '{name}': {value}")
+        return value
+
+#Convert a string to a name, names are plain strings in this interpreter
+    def cvn(self):
+        if not self.stack:
+            raise IndexError("No elements for 'cvn'")
+        if type(self.stack[-1]) is Substring:
+            self.stack[-1] = str(self.stack[-1])
+        if not isinstance(self.stack[-1], str):
+            raise TypeError("Invalid type for 'cvn': expected string")
+
+#Push a string of n zero bytes
+    def string(self):
+        if not self.stack:
+            raise IndexError("No elements for 'string'")
+        n = self.stack.pop()
+        if type(n) is not int or n < 0:
+            raise TypeError("Invalid argument: 'string' requires a non-negative integer")
+        self._allocate(sys.getsizeof("") + n)
+        self.stack.append("\0" * n)
+
 #Repeat a procedure a specified number of times
     def repeat(self):
+        for proc in self._repeat_calls():
+            self.call(proc)
+
+    def _repeat_calls(self):
         if len(self.stack) < 2:
             raise IndexError("Not enough elements for 'repeat'")
         proc, count = self.stack.pop(), self.stack.pop()
-        if not callable(proc):
-            raise TypeError("Invalid type for 'repeat': procedure must be callable")
-        for _ in range(count):
-            self.execute(proc)
+        if not (callable(proc) or isinstance(proc, list)):
+            raise TypeError("Invalid type for 'repeat': procedure must be callable or a list")
+        proc = self._closure(proc)
+        return (proc for _ in range(count))
 
 #Terminate the interpreter
     def quit(self):
@@ -510,41 +1421,388 @@ class PostScriptInterpreter:
             else:
                 raise IndexError("Index out of range for 'put'")
             self.stack.append(container)
-        elif isinstance(container, str):
+        elif isinstance(container, (str, Substring)):
             container = list(container)
             container[index] = value
             self.stack.append(''.join(container))
+        elif isinstance(container, dict):
+            container[index] = value  # Dictionaries are updated in place and, as in PostScript, not pushed back
         else:
-            raise TypeError("Invalid type for 'put': expected list or string")
+            raise TypeError("Invalid type for 'put': expected list, string or dictionary")
         
 #Apply a procedure to each element in a container
     def forall(self):
+        for proc in self._forall_calls():
+            self.call(proc)
+
+#Check the operands of forall, the returned iterator pushes each element just before its call
+    def _forall_calls(self):
         if len(self.stack) < 2:
             raise IndexError("Not enough elements for 'forall'")
         proc, container = self.stack.pop(), self.stack.pop()
-        if not callable(proc):
-            raise TypeError("Invalid type for 'forall': procedure must be callable")
-        if isinstance(container, (str, list)):
-            for item in container:
-                self.stack.append(item)
-                self.execute(proc)
-        else:
-            raise TypeError("Invalid type for 'forall': expected string or list")
-        
+        if not (callable(proc) or isinstance(proc, list)):
+            raise TypeError("Invalid type for 'forall': procedure must be callable or a list")
+        proc = self._closure(proc)
+        if isinstance(container, (str, Substring, list)):
+            return self._push_each(container, proc)
+        if isinstance(container, dict):
+            return self._push_pairs(list(container.items()), proc)  # The procedure may modify the dictionary
+        raise TypeError("Invalid type for 'forall': expected string, list or dictionary")
+
+    def _push_each(self, items, proc):
+        for item in items:
+            self.stack.append(item)
+            yield proc
+
+    def _push_pairs(self, items, proc):
+        for key, value in items:
+            self.stack.append(key)
+            self.stack.append(value)
+            yield proc
+
 #For a range of values, execute a procedure
-    def for_(self): 
+    def for_(self):
+        for proc in self._for_calls():
+            self.call(proc)
+
+    def _for_calls(self):
         if len(self.stack) < 4:
             raise IndexError("Not enough elements for 'for'")
         proc, end, step, start = self.stack.pop(), self.stack.pop(), self.stack.pop(), self.stack.pop()
-        if not callable(proc):
-            raise TypeError("Invalid type for 'for': procedure must be callable")
-        for i in range(start, end + 1, step):
-            self.stack.append(i)
-            self.execute(proc)
+        if not (callable(proc) or isinstance(proc, list)):
+            raise TypeError("Invalid type for 'for': procedure must be callable or a list")
+        return self._push_each(range(start, end + 1, step), self._closure(proc))
+
+#Check that a procedure only touches its own operands, so it can run in a worker. Procedures written as
+#string literals and procedures bound to names are checked too, since if and the loops can run them
+    def is_side_effect_free(self, proc, _checked=None):
+        if not isinstance(proc, list):
+            return False
+        checked = _checked if _checked is not None else set()
+        checked.add(id(proc))  # A procedure that refers to itself by name is only checked once
+        for token in proc:
+            if isinstance(token, str) and token.startswith("["):
+                import ast
+                try:
+                    token = ast.literal_eval(token)
+                except (ValueError, SyntaxError):
+                    return False
+            if isinstance(token, list):
+                if id(token) not in checked and not self.is_side_effect_free(token, checked):
+                    return False
+            elif not isinstance(token, (str, int, float, bool)) or token in STATEFUL_COMMANDS:
+                return False
+            elif isinstance(token, str) and token.isidentifier():
+                value = self.lookup(token)
+                if isinstance(value, list) and id(value) not in checked:
+                    if not self.is_side_effect_free(value, checked):
+                        return False
+        return True
+
+#Run a side-effect-free procedure over a container in a process pool, None means run it serially
+    def _parallel_apply(self, container, proc, name):
+        if not isinstance(container, (str, Substring, list)):
+            raise TypeError(f"Invalid type for '{name}': expected string or list")
+        if not (callable(proc) or isinstance(proc, list)):
+            raise TypeError(f"Invalid type for '{name}': procedure must be callable or a list")
+        if len(container) < self.parallel_threshold or not self.is_side_effect_free(proc):
+            return None
+        import concurrent.futures
+        workers = self.parallel_workers or os.cpu_count() or 1
+        chunk_size = -(-len(container) // workers)
+        chunks = [container[i:i + chunk_size] for i in range(0, len(container), chunk_size)]
+        settings = (self.use_lexical_scoping, self.numeric_mode, self.precision)
+        if type(proc) is Closure:
+            proc = Procedure(proc)  # Workers resolve names through the dictionaries, def writes through to them
+        jobs = [(chunk, proc, self.dict_stack, settings) for chunk in chunks]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                chunk_results = list(pool.map(_forall_chunk, jobs))
+        except Exception:
+            return None  # Unpicklable state, a dead pool or a real error the serial run will raise again
+        if any(result is None for result in chunk_results):
+            return None
+        return [value for result in chunk_results for value in result]
+
+#Apply a side-effect-free procedure to each element, pushing the results in order
+    def parallelforall(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'parallelforall'")
+        proc, container = self.stack.pop(), self.stack.pop()
+        results = self._parallel_apply(container, proc, "parallelforall")
+        if results is not None:
+            self.stack.extend(results)
+            return
+        proc = self._closure(proc)
+        for item in container:
+            self.stack.append(item)
+            self.call(proc)
+
+#Apply a side-effect-free procedure to each element, pushing the results as one list
+    def parallelmap(self):
+        if len(self.stack) < 2:
+            raise IndexError("Not enough elements for 'parallelmap'")
+        proc, container = self.stack.pop(), self.stack.pop()
+        results = self._parallel_apply(container, proc, "parallelmap")
+        if results is None:
+            proc = self._closure(proc)
+            base = len(self.stack)
+            for item in container:
+                self.stack.append(item)
+                self.call(proc)
+            if len(self.stack) < base:
+                raise IndexError("Procedure for 'parallelmap' consumed operands below its element")
+            results = self.stack[base:]
+            del self.stack[base:]
+        self.stack.append(results)
+
+#Pop the operands of a numeric operator, checking there are enough of them
+    def _operands(self, count, name):
+        if len(self.stack) < count:
+            raise IndexError(f"Not enough elements for '{name}'")
+        if count == 1:
+            return self.stack.pop()
+        b, a = self.stack.pop(), self.stack.pop()
+        return a, b
+
+#Integer division and remainder truncated toward zero, as PostScript defines idiv and mod
+    def _truncated_divmod(self, a, b, name):
+        if type(a) is not int or type(b) is not int:
+            raise TypeError(f"Operands for '{name}' must be integers")
+        if b == 0:
+            raise ZeroDivisionError("Cannot divide by zero")
+        quotient, remainder = abs(a) // abs(b), abs(a) % abs(b)
+        return (-quotient if (a < 0) != (b < 0) else quotient), (-remainder if a < 0 else remainder)
+
+#Postscript mode: an integer outside 32 bits becomes a real
+    def _ps_number(self, value):
+        if type(value) is int and not INT_MIN <= value <= INT_MAX:
+            return float(value)
+        return value
+
+#Postscript mode: integer literals too large for 32 bits are read as reals
+    def _ps_int_literal(self, text):
+        return self._ps_number(int(text))
+
+    def _ps_add(self):
+        a, b = self._operands(2, "add")
+        self.stack.append(self._ps_number(a + b))
+
+    def _ps_sub(self):
+        a, b = self._operands(2, "sub")
+        self.stack.append(self._ps_number(a - b))
+
+    def _ps_mul(self):
+        a, b = self._operands(2, "mul")
+        self.stack.append(self._ps_number(a * b))
+
+    def _ps_div(self):
+        a, b = self._operands(2, "div")
+        if b == 0:
+            raise ZeroDivisionError("Cannot divide by zero")
+        self.stack.append(float(a) / b)
+
+    def _ps_idiv(self):
+        a, b = self._operands(2, "idiv")
+        self.stack.append(self._ps_number(self._truncated_divmod(a, b, "idiv")[0]))
+
+    def _ps_mod(self):
+        a, b = self._operands(2, "mod")
+        self.stack.append(self._truncated_divmod(a, b, "mod")[1])
+
+    def _ps_abs(self):
+        self.stack.append(self._ps_number(abs(self._operands(1, "abs"))))
+
+    def _ps_neg(self):
+        self.stack.append(self._ps_number(-self._operands(1, "neg")))
+
+#Postscript mode: ceiling, floor and round keep the operand's type, so reals stay reals
+    def _ps_ceiling(self):
+        value = self._operands(1, "ceiling")
+        self.stack.append(value if type(value) is int else float(math.ceil(value)))
+
+    def _ps_floor(self):
+        value = self._operands(1, "floor")
+        self.stack.append(value if type(value) is int else float(math.floor(value)))
+
+    def _ps_round(self):
+        value = self._operands(1, "round")
+        self.stack.append(value if type(value) is int else float(math.floor(value + 0.5)))
+
+    def _ps_sqrt(self):
+        value = self._operands(1, "sqrt")
+        if value < 0:
+            raise ValueError("Cannot take the square root of a negative number")
+        self.stack.append(math.sqrt(value))
+
+#Bigint mode: integer division stays exact, falling back to a fraction
+    def _bigint_div(self):
+        a, b = self._operands(2, "div")
+        if b == 0:
+            raise ZeroDivisionError("Cannot divide by zero")
+        if type(a) is int and type(b) is int:
+            if a % b == 0:
+                self.stack.append(a // b)
+            else:
+                from fractions import Fraction
+                self.stack.append(Fraction(a, b))
+        else:
+            self.stack.append(a / b)
+
+    def _bigint_idiv(self):
+        a, b = self._operands(2, "idiv")
+        self.stack.append(self._truncated_divmod(a, b, "idiv")[0])
+
+    def _bigint_mod(self):
+        a, b = self._operands(2, "mod")
+        self.stack.append(self._truncated_divmod(a, b, "mod")[1])
+
+#Bigint mode: perfect squares give an exact integer root
+    def _bigint_sqrt(self):
+        value = self._operands(1, "sqrt")
+        if value < 0:
+            raise ValueError("Cannot take the square root of a negative number")
+        if type(value) is int:
+            root = math.isqrt(value)
+            if root * root == value:
+                self.stack.append(root)
+                return
+        try:
+            self.stack.append(math.sqrt(value))
+        except OverflowError:
+            # Past the range of reals: an exact rational from the integer square root, 8 digits after the point
+            from fractions import Fraction
+            value, scale = Fraction(value), 10 ** 8
+            self.stack.append(Fraction(math.isqrt(value.numerator * value.denominator * scale * scale),
+                                       value.denominator * scale))
+
+#Decimal mode: pop operands, turning reals from array literals into decimals by their text
+    def _decimal_operands(self, count, name):
+        operands = self._operands(count, name)
+        if count == 1:
+            return self._context.create_decimal(repr(operands)) if type(operands) is float else operands
+        return [self._context.create_decimal(repr(x)) if type(x) is float else x for x in operands]
+
+#Decimal mode: all arithmetic goes through the interpreter's own context and precision
+    def _decimal_add(self):
+        self.stack.append(self._context.add(*self._decimal_operands(2, "add")))
+
+    def _decimal_sub(self):
+        self.stack.append(self._context.subtract(*self._decimal_operands(2, "sub")))
+
+    def _decimal_mul(self):
+        self.stack.append(self._context.multiply(*self._decimal_operands(2, "mul")))
+
+    def _decimal_div(self):
+        self.stack.append(self._context.divide(*self._decimal_operands(2, "div")))
+
+    def _decimal_idiv(self):
+        self.stack.append(self._context.divide_int(*self._decimal_operands(2, "idiv")))
+
+    def _decimal_mod(self):
+        self.stack.append(self._context.remainder(*self._decimal_operands(2, "mod")))
+
+    def _decimal_abs(self):
+        self.stack.append(self._context.abs(self._context.create_decimal(self._decimal_operands(1, "abs"))))
+
+    def _decimal_neg(self):
+        self.stack.append(self._context.minus(self._context.create_decimal(self._decimal_operands(1, "neg"))))
+
+    def _decimal_ceiling(self):
+        value = self._context.create_decimal(self._decimal_operands(1, "ceiling"))
+        self.stack.append(value.to_integral_value(rounding=self._decimal.ROUND_CEILING))
+
+    def _decimal_floor(self):
+        value = self._context.create_decimal(self._decimal_operands(1, "floor"))
+        self.stack.append(value.to_integral_value(rounding=self._decimal.ROUND_FLOOR))
+
+    def _decimal_round(self):
+        # Halves go to the greater integer, as PostScript defines round: -2.5 rounds to -2
+        value = self._context.create_decimal(self._decimal_operands(1, "round"))
+        self.stack.append((value + self._decimal.Decimal("0.5")).to_integral_value(rounding=self._decimal.ROUND_FLOOR))
+
+    def _decimal_sqrt(self):
+        self.stack.append(self._context.sqrt(self._context.create_decimal(self._decimal_operands(1, "sqrt"))))
+
+#The graphics state, created on first use
+    @property
+    def graphics(self):
+        if self._graphics is None:
+            from graphics import GraphicsState
+            self._graphics = GraphicsState(*self.page_size, resolution=self.resolution)
+        return self._graphics
+
+#Pop count numbers for a graphics operator, in the order they were pushed
+    def _numbers(self, count, name):
+        if len(self.stack) < count:
+            raise IndexError(f"Not enough elements for '{name}'")
+        values = self.stack[-count:]
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) and not hasattr(value, "__float__"):
+                raise TypeError(f"Invalid type for '{name}': expected numbers")
+        del self.stack[-count:]
+        return [float(value) for value in values]
+
+#Start a new, empty current path
+    def newpath(self):
+        self.graphics.newpath()
+
+#Begin a subpath at a point
+    def moveto(self):
+        self.graphics.moveto(*self._numbers(2, "moveto"))
+
+#Add a straight line to a point
+    def lineto(self):
+        self.graphics.lineto(*self._numbers(2, "lineto"))
+
+#Add a Bezier curve through two control points to an end point
+    def curveto(self):
+        self.graphics.curveto(*self._numbers(6, "curveto"))
+
+#Close the current subpath
+    def closepath(self):
+        self.graphics.closepath()
+
+#Fill the current path with the current colour
+    def fill(self):
+        self.graphics.fill()
+
+#Stroke the current path with the current colour and line width
+    def stroke(self):
+        self.graphics.stroke()
+
+#Set a gray level between 0 and 1
+    def setgray(self):
+        self.graphics.setgray(*self._numbers(1, "setgray"))
+
+#Set red, green and blue levels between 0 and 1
+    def setrgbcolor(self):
+        self.graphics.setrgbcolor(*self._numbers(3, "setrgbcolor"))
+
+#Set the stroke line width
+    def setlinewidth(self):
+        self.graphics.setlinewidth(*self._numbers(1, "setlinewidth"))
+
+#Move the user space origin
+    def translate(self):
+        self.graphics.translate(*self._numbers(2, "translate"))
+
+#Scale the user space axes
+    def scale(self):
+        self.graphics.scale(*self._numbers(2, "scale"))
+
+#Rotate user space by an angle in degrees
+    def rotate(self):
+        self.graphics.rotate(*self._numbers(1, "rotate"))
+
+#Finish the current page, the next graphics operator starts a blank page with a fresh graphics state
+    def showpage(self):
+        self.pages.append(self._graphics.raster if self._graphics is not None else None)
+        self._graphics = None
 
 #Return a dictionary of command names to methods
     def commands(self):
-        return {
+        table = {
             "exch": self.exch,
             "pop": self.pop,
             "copy": self.copy,
@@ -565,6 +1823,13 @@ class PostScriptInterpreter:
             "sqrt": self.sqrt,
             "dict": self.dict,
             "length": self.length,
+            "maxlength": self.maxlength,
+            "currentdict": self.currentdict,
+            "known": self.known,
+            "where": self.where,
+            "undef": self.undef,
+            "load": self.load,
+            "store": self.store,
             "begin": self.begin,
             "end": self.end,
             "def": self.def_,
@@ -591,5 +1856,367 @@ class PostScriptInterpreter:
             "print": self.print_,
             "exit": self.quit,
             "stop": self.quit,
-            "forall": self.forall
+            "forall": self.forall,
+            "parallelforall": self.parallelforall,
+            "parallelmap": self.parallelmap,
+            "newpath": self.newpath,
+            "moveto": self.moveto,
+            "lineto": self.lineto,
+            "curveto": self.curveto,
+            "closepath": self.closepath,
+            "fill": self.fill,
+            "stroke": self.stroke,
+            "setgray": self.setgray,
+            "setrgbcolor": self.setrgbcolor,
+            "setlinewidth": self.setlinewidth,
+            "translate": self.translate,
+            "scale": self.scale,
+            "rotate": self.rotate,
+            "showpage": self.showpage,
+            "vmstatus": self.vmstatus,
+            "search": self.search,
+            "anchorsearch": self.anchorsearch,
+            "token": self.token,
+            "cvs": self.cvs,
+            "cvi": self.cvi,
+            "cvr": self.cvr,
+            "cvn": self.cvn,
+            "string": self.string
         }
+        for name, method in NUMERIC_OPERATORS[self.numeric_mode].items():
+            table[name] = getattr(self, method)
+        return table
+
+#Worker for parallelforall: run each element of a chunk on a fresh stack
+def _forall_chunk(job):
+    chunk, proc, dict_stack, (use_lexical_scoping, numeric_mode, precision) = job
+    interpreter = PostScriptInterpreter(use_lexical_scoping=use_lexical_scoping,
+                                        numeric_mode=numeric_mode, precision=precision)
+    interpreter.dict_stack = dict_stack
+    results = []
+    for item in chunk:
+        interpreter.stack = [item]
+        try:
+            interpreter.call(proc)
+        except IndexError:
+            return None  # The procedure reached below its element, results depend on order
+        results.extend(interpreter.stack)
+    return results
+
+
+#Split PostScript source into tokens, lines can be any iterable of strings (e.g. an open file)
+def tokenize(lines):
+    import re
+    pattern = re.compile(TOKEN_REGEX)
+    if isinstance(lines, str):
+        lines = lines.splitlines(keepends=True)
+    procs = []  # Procedure bodies still waiting for their closing brace
+    string, depth = None, 0  # Text of a string literal spanning lines and its paren depth
+    for line in lines:
+        pos = 0
+        while pos < len(line):
+            if string is not None:
+                while pos < len(line) and depth:
+                    char = line[pos]
+                    if char == "\\":
+                        string.append(line[pos:pos + 2])
+                        pos += 2
+                        continue
+                    depth += char == "("
+                    depth -= char == ")"
+                    string.append(char)
+                    pos += 1
+                if depth:
+                    break
+                token, string = "".join(string), None
+            else:
+                match = pattern.search(line, pos)
+                if not match:
+                    break
+                token, pos = match.group(), match.end()
+                if token == "(":
+                    string, depth = ["("], 1
+                    continue
+                if token.startswith("%"):
+                    continue
+                if token == "{":
+                    procs.append(Procedure())
+                    continue
+                if token == "}":
+                    if not procs:
+                        raise SyntaxError("Unmatched '}' in PostScript source")
+                    token = procs.pop()
+            if procs:
+                procs[-1].append(token)
+            else:
+                yield token
+    if procs or string is not None:
+        raise IncompleteSourceError("Unexpected end of PostScript source")
+
+#Parse PostScript numeric text: integers, reals with optional exponent and radix numbers like 16#FF
+def parse_number(text):
+    if not text or text[0] not in "+-.0123456789" or "_" in text:
+        return None
+    if "#" in text:
+        base, _, digits = text.partition("#")
+        if not base.isdigit() or not 2 <= int(base) <= 36:
+            return None
+        try:
+            return int(digits, int(base))
+        except ValueError:
+            return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+#Parse an array literal token like "['2','mul']", None if the token is anything else
+def _literal_list(token):
+    import ast
+    try:
+        value = ast.literal_eval(token)
+    except (ValueError, SyntaxError):
+        return None
+    return value if isinstance(value, list) else None
+
+# Compiled SKIP_REGEX and TOKEN_REGEX, set by scan_token on first use so importing main does not import re
+_scan_patterns = None
+
+#Scan one token of a string starting at pos, returning the token as tokenize would yield it and where it ends
+#Only the token itself is sliced out of the string, None if there is no token
+def scan_token(string, pos=0):
+    global _scan_patterns
+    if _scan_patterns is None:
+        import re
+        _scan_patterns = re.compile(SKIP_REGEX), re.compile(TOKEN_REGEX)
+    skip_pattern, token_pattern = _scan_patterns
+    pos = skip_pattern.match(string, pos).end()
+    match = token_pattern.match(string, pos)
+    if match is None:
+        return None
+    token, end = match.group(), match.end()
+    if token == "(":
+        depth = 1
+        while depth:
+            if end >= len(string):
+                raise SyntaxError("Unterminated string in 'token'")
+            char = string[end]
+            end += 2 if char == "\\" else 1
+            depth += (char == "(") - (char == ")")
+        return string[pos:end], end
+    if token == "{":
+        body = Procedure()
+        while True:
+            scanned = scan_token(string, end)
+            if scanned is None:
+                raise SyntaxError("Unterminated procedure in 'token'")
+            item, end = scanned
+            if item == "}":
+                return body, end
+            body.append(item)
+    if token == "}":
+        return token, end
+    # Like PostScript, a single whitespace character after the token is consumed with it
+    if end < len(string) and string[end].isspace():
+        end += 1
+    return token, end
+
+#Split a document into prologue tokens and per-page tokens, at DSC %%Page: comments when it has them
+#Without them pages end at each showpage, and the prologue is the leading run of `/name value def` definitions
+def split_pages(source):
+    lines = source.splitlines(keepends=True)
+    marks = [i for i, line in enumerate(lines) if line.startswith("%%Page:")]
+    if marks:
+        ends = marks[1:] + [next((i for i in range(marks[-1], len(lines))
+                                  if lines[i].startswith(("%%Trailer", "%%EOF"))), len(lines))]
+        prologue = list(tokenize(lines[:marks[0]]))
+        return prologue, [list(tokenize(lines[start:end])) for start, end in zip(marks, ends)]
+    tokens = list(tokenize(lines))
+    split = 0
+    while (split + 2 < len(tokens) and isinstance(tokens[split], str) and tokens[split].startswith("/")
+           and tokens[split + 2] == "def" and tokens[split + 1] not in ("def", "showpage")):
+        split += 3
+    prologue, pages, page = tokens[:split], [], []
+    for token in tokens[split:]:
+        page.append(token)
+        if token == "showpage":
+            pages.append(page)
+            page = []
+    if page:
+        pages.append(page)
+    return prologue, pages
+
+#Render the pages of a document concurrently, returning one raster per page (None if it painted nothing) in page order
+#Tokens in preamble, e.g. a prelude, run in every worker before the document's own prologue
+def render_pages(source, workers=None, preamble=(), **settings):
+    prologue, pages = split_pages(source)
+    prologue = list(preamble) + prologue
+    if workers == 1 or len(pages) < 2:
+        _start_page_worker(prologue, settings)
+        return [_render_page(page) for page in pages]
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_start_page_worker,
+                                                initargs=(prologue, settings)) as pool:
+        return list(pool.map(_render_page, pages))
+
+# Per-worker interpreter settings and dictionary stack after the prologue, set by _start_page_worker
+_page_worker = None
+
+#Run the prologue once in this worker, every page it renders starts from a copy of the result
+def _start_page_worker(prologue, settings):
+    global _page_worker
+    interpreter = PostScriptInterpreter(**settings)
+    interpreter.execute_stream(prologue)
+    _page_worker = (settings, interpreter.dict_stack)
+
+#Run one page on a fresh interpreter seeded with the prologue's definitions
+def _render_page(tokens):
+    import copy
+    settings, dict_stack = _page_worker
+    interpreter = PostScriptInterpreter(**settings)
+    interpreter.dict_stack = copy.deepcopy(dict_stack)
+    interpreter.execute_stream(tokens)
+    if interpreter.pages:
+        return interpreter.pages[-1]
+    return interpreter._graphics.raster if interpreter._graphics is not None else None
+
+#Save rendered pages, an output name containing %d gets one file per page and is required for several pages
+#A page that painted nothing is saved blank, so the numbering always matches the document
+def save_pages(rasters, output, page_size=(612, 792), resolution=72):
+    if len(rasters) > 1 and "%d" not in output:
+        raise ValueError(f"The job has {len(rasters)} pages, the output name needs %d to number them")
+    for number, raster in enumerate(rasters, 1):
+        if raster is None:
+            from graphics import GraphicsState
+            raster = GraphicsState(*page_size, resolution=resolution).raster
+        raster.save(output % number if "%d" in output else output)
+
+#Tokenize a prelude once and reuse the result from a marshal cache next to it until the file changes
+def load_prelude(path):
+    import marshal
+    info = os.stat(path)
+    key = (info.st_mtime_ns, info.st_size)
+    cache_path = path + "c"
+    try:
+        with open(cache_path, "rb") as cache:
+            cached_key, tokens = marshal.load(cache)
+        if tuple(cached_key) == key:
+            return _procedures(tokens)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    with open(path) as source:
+        tokens = list(tokenize(source))
+    try:
+        with open(cache_path, "wb") as cache:
+            marshal.dump((key, _plain_lists(tokens)), cache)
+    except OSError:
+        pass  # A read-only location just means no cache
+    return tokens
+
+#Marshal only stores plain lists, so procedure bodies are cached as lists and turned back into Procedures
+def _plain_lists(tokens):
+    return [_plain_lists(token) if isinstance(token, list) else token for token in tokens]
+
+def _procedures(tokens):
+    return [Procedure(_procedures(token)) if isinstance(token, list) else token for token in tokens]
+
+#Render the operand stack the way the REPL shows it
+def format_stack(stack):
+    return " ".join(repr(item) for item in stack)
+
+#Read-eval-print loop, showing the stack depth in the prompt and the stack after each line
+def repl(interpreter, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    source = ""  # Lines read so far of a procedure or string that is still open
+    while True:
+        stdout.write("... " if source else f"PS<{len(interpreter.stack)}> ")
+        stdout.flush()
+        line = stdin.readline()
+        if not line:
+            if source:
+                stdout.write("\nError: Unexpected end of PostScript source")
+            stdout.write("\n")
+            return
+        source += line
+        try:
+            tokens = list(tokenize(source))  # Nothing runs until the whole input is read
+        except IncompleteSourceError:
+            continue
+        except SyntaxError as error:
+            source = ""
+            stdout.write(f"Error: {error}\n")
+            continue
+        source = ""
+        try:
+            interpreter.execute_stream(tokens)
+        except SystemExit:
+            return
+        except (IndexError, TypeError, ValueError, KeyError, ArithmeticError, SyntaxError, MemoryError) as error:
+            stdout.write(f"Error: {error}\n")
+        if interpreter.stack:
+            stdout.write(format_stack(interpreter.stack) + "\n")
+
+#Command-line entry point: python -m main [-i] [--prelude FILE] [-c CODE] [FILE ...]
+def run_cli(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m main", description="Run PostScript programs.")
+    parser.add_argument("files", nargs="*", help="PostScript files to run, '-' reads stdin")
+    parser.add_argument("-c", dest="code", help="program passed in as a string")
+    parser.add_argument("-i", dest="interactive", action="store_true", help="start the REPL after running")
+    parser.add_argument("--prelude", action="append", default=[], help="file run first, cached in compiled form")
+    parser.add_argument("--lexical", action="store_true", help="use lexical scoping")
+    parser.add_argument("-o", dest="output",
+                        help="write pages to .png or .ppm files, %%d numbers them and is required for several pages")
+    parser.add_argument("--vm-limit", type=int, help="fail the job once its strings, arrays and dictionaries exceed N bytes")
+    parser.add_argument("-j", dest="jobs", type=int, help="render the pages of each file in parallel with N workers")
+    args = parser.parse_args(argv)
+
+    interpreter = PostScriptInterpreter(use_lexical_scoping=args.lexical, vm_limit=args.vm_limit)
+    interactive = args.interactive or (not args.files and args.code is None and sys.stdin.isatty())
+    preamble = []  # Prelude and -c tokens, replayed in every page worker
+    try:
+        for path in args.prelude:
+            tokens = load_prelude(path)
+            preamble.extend(tokens)
+            interpreter.execute_stream(tokens)
+        if args.code is not None:
+            tokens = list(tokenize(args.code))
+            preamble.extend(tokens)
+            interpreter.execute_stream(tokens)
+        for path in args.files:
+            if args.jobs:
+                with open(sys.stdin.fileno() if path == "-" else path, closefd=path != "-") as source:
+                    rasters = render_pages(source.read(), workers=args.jobs, preamble=preamble,
+                                           use_lexical_scoping=args.lexical, vm_limit=args.vm_limit)
+                if args.output:
+                    save_pages(rasters, args.output, interpreter.page_size, interpreter.resolution)
+                continue
+            if path == "-":
+                interpreter.execute_stream(tokenize(sys.stdin))
+            else:
+                with open(path) as source:
+                    interpreter.execute_stream(tokenize(source))
+        if not args.files and args.code is None and not interactive:
+            interpreter.execute_stream(tokenize(sys.stdin))
+        if args.output and not args.jobs:
+            current = [interpreter._graphics.raster] if interpreter._graphics is not None else []
+            save_pages(interpreter.pages + current, args.output, interpreter.page_size, interpreter.resolution)
+    except SystemExit:
+        return 0
+    except (OSError, IndexError, TypeError, ValueError, KeyError, ArithmeticError, SyntaxError,
+            MemoryError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    if interactive:
+        repl(interpreter)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -1,5 +1,5 @@
 import pytest # type: ignore
-from main import PostScriptInterpreter  
+from main import PostScriptInterpreter, Procedure, tokenize, load_prelude
 
 @pytest.fixture
 def interpreter():
@@ -90,7 +90,7 @@ def test_sqrt(interpreter):
     assert interpreter.stack == [3.0]
 
 def test_dict(interpreter):
-    interpreter.execute(["dict"])
+    interpreter.execute(["0", "dict"])
     assert interpreter.stack == [{}]
 
 def test_length(interpreter):
@@ -163,7 +163,389 @@ def test_get(interpreter):
 
 
 def test_begin_end_dynamic(interpreter):
-    interpreter.execute(["dict", "begin", "/x", "10", "def", "x", "end", "x"])
+    interpreter.execute(["1", "dict", "begin", "/x", "10", "def", "x", "end", "x"])
     assert interpreter.stack == [10, 'x']
 
 
+
+def test_parallelforall_serial(interpreter):
+    interpreter.execute(["[1,2,3]", "['2', 'mul']", "parallelforall"])
+    assert interpreter.stack == [2, 4, 6]
+
+def test_parallelmap_uses_pool():
+    interpreter = PostScriptInterpreter(parallel_workers=2)
+    interpreter.parallel_threshold = 1
+    interpreter.execute(["/k", "3", "def", "[1,2,3,4,5]", "['k', 'mul']", "parallelmap"])
+    assert interpreter.stack == [[3, 6, 9, 12, 15]]
+    # The serial fallback gives the same stack, so check the pool itself returned the results
+    assert interpreter._parallel_apply([1, 2, 3, 4, 5], ["k", "mul"], "parallelmap") == [3, 6, 9, 12, 15]
+
+def test_parallelforall_falls_back_for_shared_state():
+    interpreter = PostScriptInterpreter(parallel_workers=2)
+    interpreter.parallel_threshold = 1
+    interpreter.execute(["0", "[1,2,3,4]", "['add']", "parallelforall"])
+    assert interpreter.stack == [10]
+    assert interpreter._parallel_apply([1, 2, 3, 4], ["add"], "parallelforall") is None
+
+def test_is_side_effect_free(interpreter):
+    assert interpreter.is_side_effect_free(["2", "mul"])
+    assert not interpreter.is_side_effect_free(["/x", "1", "def"])
+    assert not interpreter.is_side_effect_free(["true", "['/seen','true','def']", "if"])
+    interpreter.execute(["/mark", "['/seen','true','def']", "def", "/twice", "['2','mul']", "def"])
+    assert not interpreter.is_side_effect_free(["true", "mark", "if"])
+    assert interpreter.is_side_effect_free(["true", "twice", "if"])
+    assert not interpreter.is_side_effect_free(["[9]", "buf", "copy", "pop"])  # Copying into an array writes it
+
+def test_parallelforall_keeps_side_effects_of_literal_procedures():
+    interpreter = PostScriptInterpreter(parallel_workers=2)
+    interpreter.parallel_threshold = 1
+    interpreter.execute(["[1,2,3,4]", "['true', \"['/seen','true','def']\", 'if']", "parallelforall",
+                         "/seen", "where"])
+    assert interpreter.stack[-1] is True
+
+def test_tokenize(interpreter):
+    tokens = list(tokenize("/sq { dup mul } def % square\n(a (b) c) 3"))
+    assert tokens == ["/sq", ["dup", "mul"], "def", "(a (b) c)", "3"]
+
+def test_execute_stream(interpreter):
+    interpreter.execute_stream(tokenize("(Hello) length true { 1 add } if { 2 }"))
+    assert interpreter.stack == [6, ["2"]]
+
+def test_nested_procedures_are_data(interpreter, capsys):
+    interpreter.execute_stream(tokenize("true { false { (should-not-print) print } if } if { { 1 } }"))
+    assert capsys.readouterr().out == ""
+    assert interpreter.stack == [[["1"]]]
+
+def test_load_prelude_cache(tmp_path, interpreter):
+    prelude = tmp_path / "prelude.ps"
+    prelude.write_text("/x 42 def")
+    assert load_prelude(str(prelude)) == ["/x", "42", "def"]
+    assert (tmp_path / "prelude.psc").exists()
+    interpreter.execute_stream(load_prelude(str(prelude)))
+    interpreter.execute("x")
+    assert interpreter.stack == [42]
+
+def test_load_prelude_cache_keeps_procedures(tmp_path, interpreter):
+    prelude = tmp_path / "prelude.ps"
+    prelude.write_text("/sq { dup mul } def")
+    load_prelude(str(prelude))
+    tokens = load_prelude(str(prelude))  # Second load comes from the cache
+    assert type(tokens[1]) is Procedure
+    interpreter.execute_stream(tokens)
+    interpreter.execute_stream(tokenize("3 true sq if"))
+    assert interpreter.stack == [9]
+
+def test_ceiling_floor_negative_and_large(interpreter):
+    interpreter.execute(["-7.5", "ceiling", "-7.5", "floor", "9007199254740993", "ceiling"])
+    assert interpreter.stack == [-7, -8, 9007199254740993]
+
+def test_postscript_mode_overflows_to_real():
+    interpreter = PostScriptInterpreter(numeric_mode="postscript")
+    interpreter.execute(["2147483647", "1", "add", "-7", "2", "idiv", "-7", "2", "mod", "7.2", "floor"])
+    assert interpreter.stack == [2147483648.0, -3, -1, 7.0]
+    assert type(interpreter.stack[0]) is float
+
+def test_bigint_mode_stays_exact():
+    from fractions import Fraction
+    interpreter = PostScriptInterpreter(numeric_mode="bigint")
+    interpreter.execute(["100000000000000000000", "dup", "mul", "sqrt", "7", "3", "div"])
+    assert interpreter.stack == [10 ** 20, Fraction(7, 3)]
+    interpreter.execute(["clear", str(10 ** 400 + 1), "sqrt"])
+    root = interpreter.stack.pop()
+    assert abs(root - 10 ** 200) < Fraction(1, 10 ** 7)
+
+def test_decimal_mode_precision():
+    from decimal import Decimal
+    interpreter = PostScriptInterpreter(numeric_mode="decimal", precision=10)
+    interpreter.execute(["0.1", "0.2", "add", "1", "3", "div", "2.5", "round"])
+    assert interpreter.stack == [Decimal("0.3"), Decimal("0.3333333333"), Decimal("3")]
+    interpreter.execute(["clear", "-2.5", "round", "-2.6", "round", "-2.4", "round"])
+    assert interpreter.stack == [Decimal("-2"), Decimal("-3"), Decimal("-2")]
+
+def test_decimal_mode_reals_inside_arrays():
+    from decimal import Decimal
+    interpreter = PostScriptInterpreter(numeric_mode="decimal")
+    interpreter.execute(["[1.5,2]", "['1','add']", "forall", "[0.1]", "['0.2','add','neg']", "forall"])
+    assert interpreter.stack == [Decimal("2.5"), 3, Decimal("-0.3")]
+
+def test_unknown_numeric_mode():
+    with pytest.raises(ValueError):
+        PostScriptInterpreter(numeric_mode="complex")
+
+def test_dict_capacity(interpreter):
+    interpreter.execute(["10", "dict", "dup", "maxlength", "exch", "length"])
+    assert interpreter.stack == [10, 0]
+
+def test_dict_requires_capacity(interpreter):
+    with pytest.raises(IndexError):
+        interpreter.execute(["dict"])
+    with pytest.raises(TypeError):
+        interpreter.execute(["(ten)", "dict"])
+    interpreter.execute(["1", "2", "add", "dict", "maxlength"])
+    assert interpreter.stack == [3]
+
+def test_dict_put_get_known(interpreter):
+    interpreter.execute(["5", "dict", "/d", "exch", "def",
+                         "d", "/k", "42", "put", "d", "/k", "get", "d", "/k", "known", "d", "/z", "known"])
+    assert interpreter.stack == [42, True, False]
+
+def test_where_load_store_undef(interpreter):
+    interpreter.execute(["/x", "1", "def", "1", "dict", "begin", "/x", "2", "store", "/x", "load",
+                         "currentdict", "/x", "known", "end", "/x", "where"])
+    assert interpreter.stack == [2, False, interpreter.dict_stack[0], True]
+    interpreter.execute(["pop", "/x", "undef", "clear", "/x", "where"])
+    assert interpreter.stack == [False]
+
+def test_dict_forall(interpreter):
+    interpreter.execute(["2", "dict", "dup", "/a", "1", "put", "dup", "/b", "2", "put", "['exch', 'pop']", "forall", "add"])
+    assert interpreter.stack == [3]
+
+def test_dict_many_entries(interpreter):
+    interpreter.execute(["100000", "dict", "/d", "exch", "def"])
+    for i in range(100000):
+        interpreter.execute(["d", str(i), str(i), "put"])
+    interpreter.execute(["d", "length", "d", "99999", "get"])
+    assert interpreter.stack == [100000, 99999]
+
+def test_run_steps(interpreter):
+    interpreter.load_program(["1", ["2", "3"], "add", "add"])
+    assert interpreter.run_steps(2)
+    assert interpreter.stack == [1, 2]
+    assert not interpreter.run_steps(10)
+    assert interpreter.stack == [6]
+    assert not interpreter.run_steps(1)
+
+def test_steps_progress(interpreter):
+    progress = list(interpreter.steps(["1"] * 5, chunk_size=2))
+    assert progress == [2, 4, 5]
+    assert interpreter.stack == [1] * 5
+    assert list(interpreter.steps(["1"] * 4, chunk_size=2)) == [2, 4]
+
+def test_steps_count_loop_bodies(interpreter, capsys):
+    # 4 top-level tokens, then 10 runs of a 2 token body
+    progress = list(interpreter.steps(list(tokenize("0 10 { 1 add } repeat")), chunk_size=5))
+    assert progress == [5, 10, 15, 20, 24]
+    assert interpreter.stack == [10]
+    interpreter.stack = []
+    list(interpreter.steps(list(tokenize("false { (oops) print } if [1,2] { { 3 } } forall"))))
+    assert capsys.readouterr().out == ""
+    assert interpreter.stack == [1, ["3"], 2, ["3"]]
+
+def test_async_run_interleaves():
+    import asyncio
+    first, second = PostScriptInterpreter(), PostScriptInterpreter()
+    order = []
+
+    async def watch():
+        for _ in range(3):
+            order.append(len(first.stack))
+            await asyncio.sleep(0)
+
+    async def main():
+        return (await asyncio.gather(first.run(["1"] * 6, chunk_size=2), watch(), second.run(["2", "3", "mul"])))[0]
+
+    assert asyncio.run(main()) == [1] * 6
+    assert order == [2, 4, 6]
+    assert second.stack == [6]
+
+def test_fill_triangle():
+    pytest.importorskip("numpy")
+    interpreter = PostScriptInterpreter(page_size=(100, 100))
+    interpreter.execute(["0", "0", "1", "setrgbcolor", "10", "10", "moveto", "90", "10", "lineto",
+                         "90", "90", "lineto", "closepath", "fill"])
+    pixels = interpreter.graphics.raster.pixels
+    assert list(pixels[50, 80]) == [0, 0, 255]  # Row 50 is y = 49.5, inside the triangle
+    assert list(pixels[20, 20]) == [255, 255, 255]
+    assert interpreter.stack == []
+
+def test_stroke_transformed_curve():
+    pytest.importorskip("numpy")
+    interpreter = PostScriptInterpreter(page_size=(100, 100))
+    interpreter.execute(["50", "50", "translate", "90", "rotate", "4", "setlinewidth",
+                         "0", "0", "moveto", "10", "20", "20", "20", "30", "0", "curveto", "stroke"])
+    pixels = interpreter.graphics.raster.pixels
+    assert list(pixels[20, 50]) == [0, 0, 0]  # The curve ends at (50, 80) once rotated onto the y axis
+    assert list(pixels[100 - 50, 80]) == [255, 255, 255]
+
+def test_raster_save(tmp_path):
+    pytest.importorskip("numpy")
+    interpreter = PostScriptInterpreter(page_size=(10, 5))
+    interpreter.execute(["0.5", "setgray", "0", "0", "moveto", "10", "0", "lineto", "10", "5", "lineto", "fill"])
+    interpreter.graphics.raster.save(str(tmp_path / "page.ppm"))
+    interpreter.graphics.raster.save(str(tmp_path / "page.png"))
+    assert (tmp_path / "page.ppm").read_bytes().startswith(b"P6\n10 5\n255\n")
+    assert (tmp_path / "page.png").read_bytes().startswith(b"\x89PNG")
+
+def test_lineto_without_current_point():
+    pytest.importorskip("numpy")
+    interpreter = PostScriptInterpreter()
+    with pytest.raises(ValueError):
+        interpreter.execute(["1", "1", "lineto"])
+
+@pytest.fixture
+def interpreter_slots():
+    return PostScriptInterpreter(use_lexical_scoping=True, resolve_slots=True)
+
+def test_slots_shadowing(interpreter_slots, capsys):
+    interpreter_slots.execute(["/x", "42", "def", "1", "dict", "begin", "/x", "100", "def", "x", "end", "x", "print"])
+    assert capsys.readouterr().out.strip() == "42"
+    assert interpreter_slots.stack == [100]
+
+def test_slots_enclosing_scopes(interpreter_slots):
+    interpreter_slots.execute(["/x", "1", "def", "1", "dict", "begin", "/y", "2", "def",
+                               "1", "dict", "begin", "x", "y", "add", "end", "end"])
+    assert interpreter_slots.stack == [3]
+
+def test_slots_procedure_captures_environment(interpreter_slots):
+    source = "/x 1 def /p { x } def 1 dict begin /x 2 def true p if end"
+    interpreter_slots.execute_stream(tokenize(source))
+    assert interpreter_slots.stack == [1]
+    dynamic = PostScriptInterpreter()
+    dynamic.execute_stream(tokenize(source))
+    assert dynamic.stack == [2]
+
+def test_slots_procedure_literal_compiled_once(interpreter_slots, monkeypatch):
+    compiled = []
+    compile = interpreter_slots.compile
+    monkeypatch.setattr(interpreter_slots, "compile", lambda command: compiled.append(command) or compile(command))
+    interpreter_slots.execute(["/x", "1", "def", "/p", "['x']", "def",
+                               "1", "dict", "begin", "/x", "2", "def", "true", "p", "if", "end",
+                               "0", "[1,2,3,4,5]", "['x','add','add']", "forall"])
+    assert interpreter_slots.stack == [1, 20]
+    assert len(compiled) == 1
+
+def test_slots_begin_across_compile_units(interpreter_slots):
+    interpreter_slots.execute_stream(tokenize("/x 1 def 1 dict begin /x 2 def"))
+    interpreter_slots.execute_stream(tokenize("x end x"))
+    assert interpreter_slots.stack == [2, 1]
+
+def test_slots_see_the_begun_dictionary(interpreter_slots):
+    source = "/d 1 dict def d /x 5 put /x 1 def d begin x end"
+    interpreter_slots.execute_stream(tokenize(source))
+    lexical = PostScriptInterpreter(use_lexical_scoping=True)
+    lexical.execute_stream(tokenize(source))
+    assert interpreter_slots.stack == lexical.stack == [5]
+
+@pytest.mark.parametrize("source", [
+    "/x 1 def currentdict /x 5 put x",
+    "/x 1 def currentdict /x undef x",
+    "/x 1 def 1 dict begin /x 2 def /d 1 dict def currentdict d copy pop /x 3 def x d /x get end",
+    "1 dict begin /x 1 def currentdict /x 7 put x end",
+])
+def test_slots_follow_dictionary_changes(interpreter_slots, source):
+    interpreter_slots.execute_stream(tokenize(source))
+    lexical = PostScriptInterpreter(use_lexical_scoping=True)
+    lexical.execute_stream(tokenize(source))
+    assert interpreter_slots.stack == lexical.stack
+
+def test_compile_resolves_names(interpreter_slots):
+    from main import LoadSlot, PushSlot, EnterBlock
+    code = interpreter_slots.compile(["/a", "1", "def", "1", "dict", "begin", "/b", "a", "def", "b", "end", "add"])
+    assert isinstance(code[0], PushSlot) and code[0].depth is None
+    assert isinstance(code[5], EnterBlock)
+    assert isinstance(code[7], LoadSlot) and code[7].depth is None
+    assert isinstance(code[9], LoadSlot) and code[9].depth == 0
+    assert code[-1] == "add"
+
+def test_resolve_slots_requires_lexical():
+    with pytest.raises(ValueError):
+        PostScriptInterpreter(resolve_slots=True)
+
+def test_vm_accounting(interpreter):
+    interpreter.execute(["vmstatus"])
+    assert interpreter.stack[:2] == [0, 0]
+    interpreter.execute(["clear", "(Hello world)", "100", "dict", "[1,2,3,4,5]", "1", "3", "getinterval"])
+    used = interpreter.vm_used
+    assert used > 100 * 48
+    interpreter.execute(["vmstatus"])
+    assert interpreter.stack[-2] == used
+    interpreter.reset_vm()
+    assert interpreter.vm_used == 0
+    limited = PostScriptInterpreter(vm_limit=100000)
+    limited.execute_stream(tokenize("5000 { (abc) pop } repeat"))  # The literal is made, and charged, once
+    assert 0 < limited.vm_used < 1000
+
+def test_vm_limit():
+    interpreter = PostScriptInterpreter(vm_limit=10000)
+    interpreter.execute(["10", "dict", "vmstatus"])
+    assert interpreter.stack[-1] == 10000
+    used = interpreter.vm_used
+    with pytest.raises(MemoryError):
+        interpreter.execute(["1000", "dict"])
+    assert interpreter.vm_used == used  # A refused allocation is not charged
+
+def test_copy_composites(interpreter):
+    interpreter.execute(["[1,2]", "[0,0,0]", "copy", "(ab)", "(xyz)", "copy"])
+    assert interpreter.stack == [[1, 2], "ab"]
+    interpreter.execute(["clear", "/d", "1", "dict", "def", "d", "/a", "1", "put",
+                         "2", "dict", "dup", "/b", "2", "put", "d", "exch", "copy", "length"])
+    assert interpreter.stack == [2]
+    interpreter.reset_vm()
+    interpreter.execute(["clear", "1", "2", "2", "copy", "clear", "0", "dict", "d", "exch", "copy", "pop"])
+    assert interpreter.vm_used == 64 + 48  # Stack copies are free, the one entry past capacity is charged
+    with pytest.raises(IndexError):
+        interpreter.execute(["[1,2]", "[0]", "copy"])
+
+def test_copy_zero(interpreter):
+    interpreter.execute(["1", "2", "0", "copy"])
+    assert interpreter.stack == [1, 2]
+
+def test_search(interpreter):
+    interpreter.execute(["(abbc)", "(bb)", "search"])
+    assert interpreter.stack == ["c", "bb", "a", True]
+    interpreter.execute(["clear", "(abc)", "(x)", "search"])
+    assert interpreter.stack == ["abc", False]
+
+def test_anchorsearch(interpreter):
+    interpreter.execute(["(abc)", "(ab)", "anchorsearch", "(abc)", "(b)", "anchorsearch"])
+    assert interpreter.stack == ["c", "ab", True, "abc", False]
+
+def test_token(interpreter):
+    interpreter.execute(["(  15 (s) {1 add} /n)", "token"])
+    assert interpreter.stack == ["(s) {1 add} /n", 15, True]
+    values = []
+    while interpreter.stack.pop():
+        values.append(interpreter.stack.pop())
+        interpreter.execute("token")
+    assert values == [15, "s", ["1", "add"], "n"]
+    assert interpreter.stack == []
+
+def test_token_rest_is_a_view(interpreter):
+    from main import Substring
+    text = "abc (needle) 12"
+    interpreter.stack = [text]
+    interpreter.execute("token")
+    rest = interpreter.stack[0]
+    assert type(rest) is Substring and rest.base is text  # Nothing but the token was copied
+    interpreter.execute(["pop", "pop", "dup", "length", "exch", "dup", "0", "get", "exch", "dup", "(needle)", "eq",
+                         "exch", "(12)", "search"])
+    assert interpreter.stack == [11, "(", False, "", "12", "(needle) ", True]
+    interpreter.execute(["clear", "(a b)", "token", "pop", "pop", "1", "def", "b", "(a 42)", "token", "pop", "pop", "cvi"])
+    assert interpreter.stack == [1, 42]
+    assert list(interpreter.dict_stack[-1]) == ["b"] and type(list(interpreter.dict_stack[-1])[0]) is str
+
+def test_conversions_follow_numeric_mode():
+    from decimal import Decimal
+    decimal = PostScriptInterpreter(numeric_mode="decimal")
+    decimal.execute(["(1.5)", "cvr", "1", "add", "2", "cvr"])
+    assert decimal.stack == [Decimal("2.5"), Decimal("2")]
+    postscript = PostScriptInterpreter(numeric_mode="postscript")
+    postscript.execute(["2147483647.7", "cvi"])
+    assert postscript.stack == [2147483647]
+    with pytest.raises(ValueError):
+        postscript.execute(["5000000000.7", "cvi"])
+    for value in ("1e400", "1e400 neg"):
+        with pytest.raises(ValueError):
+            PostScriptInterpreter().execute(value.split() + ["cvi"])
+    with pytest.raises(ValueError):
+        PostScriptInterpreter().execute([str(10 ** 400), "cvr"])
+
+def test_conversions(interpreter):
+    interpreter.execute(["(  -3.7 )", "cvi", "(16#FF)", "cvr", "42", "10", "string", "cvs", "true", "(xxxxx)", "cvs"])
+    assert interpreter.stack == [-3, 255.0, "42", "true"]
+    with pytest.raises(IndexError):
+        interpreter.execute(["12345", "(ab)", "cvs"])
+
+def test_string_operator(interpreter):
+    interpreter.execute(["3", "string", "length", "(abc)", "cvn"])
+    assert interpreter.stack == [3, "abc"]